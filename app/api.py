@@ -7,7 +7,43 @@ import flask
 import flask_sqlalchemy
 import flask_restless
 
-from orm import Game, Developer, Article, Tweet, Video, Platform, Genre
+from datetime import datetime
+import time
+
+from keyset import KeysetPager
+from orm import (Game, Developer, Article, Tweet, Video, Platform, Genre,
+                 PlayerCount)
+from rank import RankIndex
+from responses import ResponseCache
+from search import SearchIndex
+from version import VERSION
+
+"""
+The largest number of games that /v1/top returns
+"""
+TOP_LIMIT = 500
+
+"""
+The default and largest number of hits per group that /v1/search returns
+"""
+SEARCH_RESULTS = 100
+SEARCH_LIMIT = 500
+
+"""
+Paths and URL rules whose responses change without a dataset version change.
+They are neither cached nor validated.
+"""
+VOLATILE_PATHS = ['/v1/stat/cache', '/v1/stat/game/<int:game_id>/players']
+
+"""
+The grid models and the columns that their endpoints leave out
+"""
+GRID_EXCLUDES = {
+    Game: ['background', 'c_name', 'screenshots', 'summary', 'tweets',
+           'articles', 'developers', 'videos'],
+    Developer: ['c_name', 'description', 'games', 'tweets', 'articles'],
+    Article: ['c_title', 'introduction', 'games', 'developers']
+}
 
 
 def generate_api(app, db):
@@ -15,6 +51,20 @@ def generate_api(app, db):
     Generate the API endpoints.
     """
 
+    # Answer conditional requests from the dataset version
+    VERSION.init_app(app, exclude=VOLATILE_PATHS)
+
+    # Cache GET responses until the dataset changes
+    responses = ResponseCache()
+    responses.init_app(app, exclude=VOLATILE_PATHS)
+
+    @app.route('/v1/stat/cache')
+    def stat_cache():
+        """
+        Return the response cache counters
+        """
+        return flask.jsonify(responses.stats())
+
     # Create the API manager
     API = flask_restless.APIManager(app, flask_sqlalchemy_db=db)
 
@@ -26,18 +76,14 @@ def generate_api(app, db):
     API.create_api(Video, methods=['GET'], url_prefix='/v1')
 
     # Generate optimized grid endpoints
-    API.create_api(Game, methods=['GET'], url_prefix='/v1/grid',
-                   exclude_columns=['background', 'c_name', 'screenshots',
-                                    'summary', 'tweets', 'articles',
-                                    'developers', 'videos'])
-
-    API.create_api(Developer, methods=['GET'], url_prefix='/v1/grid',
-                   exclude_columns=['c_name', 'description', 'games', 'tweets',
-                                    'articles'])
+    for Model, exclude in GRID_EXCLUDES.items():
+        API.create_api(Model, methods=['GET'], url_prefix='/v1/grid',
+                       exclude_columns=exclude)
 
-    API.create_api(Article, methods=['GET'], url_prefix='/v1/grid',
-                   exclude_columns=['c_title', 'introduction', 'games',
-                                    'developers'])
+    # Page the grid endpoints by cursor when one is given
+    pager = KeysetPager(db.session, {Model.__table__.name: (Model, exclude)
+                                     for Model, exclude in GRID_EXCLUDES.items()})
+    pager.init_app(app)
 
     # Generate unpaginated list endpoints
     API.create_api(Game, methods=['GET'], url_prefix='/v1/list',
@@ -51,6 +97,25 @@ def generate_api(app, db):
     API.create_api(Genre, methods=['GET'], url_prefix='/v1/list',
                    results_per_page=-1)
 
+    # Keep the games ordered by VINDEX
+    ranks = RankIndex()
+
+    # Index model names for search
+    search_index = SearchIndex()
+
+    @app.route('/v1/search')
+    def search():
+        """
+        Return the games, developers, articles, and videos whose names contain
+        the query, ranked by VINDEX
+        """
+        limit = min(max(flask.request.args.get(
+            'results_per_page', SEARCH_RESULTS, type=int), 0), SEARCH_LIMIT)
+
+        search_index.refresh()
+        return flask.jsonify(search_index.search(
+            flask.request.args.get('q', ''), limit))
+
     # Generate stat endpoints
     @app.route('/v1/stat/game/count')
     def stat_game_count():
@@ -71,3 +136,59 @@ def generate_api(app, db):
     @app.route('/v1/stat/tweet/count')
     def stat_tweet_count():
         return str(Tweet.query.count())
+
+    @app.route('/v1/stat/game/<int:game_id>/players')
+    def stat_game_players(game_id):
+        """
+        Return the player counts of a game between the start and end unix
+        timestamps. The resolution defaults to the finest one that is still
+        kept for the start of the range.
+        """
+        now = time.time()
+        end = flask.request.args.get('end', now, type=float)
+        start = flask.request.args.get(
+            'start', end - PlayerCount.RETENTION[PlayerCount.RAW], type=float)
+
+        resolution = flask.request.args.get('resolution', type=int)
+        if resolution is None:
+            resolution = PlayerCount.DAILY
+            for candidate in [PlayerCount.RAW, PlayerCount.HOURLY]:
+                if now - start <= PlayerCount.RETENTION[candidate]:
+                    resolution = candidate
+                    break
+
+        points = PlayerCount.query \
+            .filter(PlayerCount.game_id == game_id,
+                    PlayerCount.resolution == resolution,
+                    PlayerCount.timestamp >= datetime.fromtimestamp(start),
+                    PlayerCount.timestamp <= datetime.fromtimestamp(end)) \
+            .order_by(PlayerCount.timestamp)
+
+        return flask.jsonify({'resolution': resolution, 'objects': [
+            {'timestamp': point.timestamp.timestamp(), 'players': point.players,
+             'peak': point.peak} for point in points]})
+
+    @app.route('/v1/stat/game/<int:game_id>/rank')
+    def stat_game_rank(game_id):
+        """
+        Return the VINDEX rank of a game
+        """
+        ranks.refresh()
+        rank = ranks.rank(game_id)
+        if rank is None:
+            flask.abort(404)
+
+        return flask.jsonify({'game_id': game_id, 'rank': rank,
+                              'num_results': len(ranks)})
+
+    @app.route('/v1/top')
+    def top():
+        """
+        Return the n games with the highest VINDEX
+        """
+        n = min(max(flask.request.args.get('n', 50, type=int), 0), TOP_LIMIT)
+
+        ranks.refresh()
+        return flask.jsonify({'objects': [
+            {'rank': rank + 1, 'game_id': game_id, 'vindex': vindex}
+            for rank, (game_id, vindex) in enumerate(ranks.top(n))]})
@@ -0,0 +1,166 @@
+# --------------------------------
+# Keyset Pagination              -
+# Copyright (C) 2018 GameFrame   -
+# --------------------------------
+
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import date, datetime
+import json
+
+import flask
+from flask_restless.helpers import get_relations, to_dict
+from flask_restless.search import create_query
+from sqlalchemy import and_, or_
+
+from responses import LocalBackend
+from version import VERSION
+
+"""
+This module serves pages of the grid endpoints after an opaque cursor instead
+of an offset. A cursor holds the sort key and primary key of the last row of
+the previous page, so every page is one index range scan.
+
+Rows are ordered by the sort key and then by the primary key, both in the
+requested direction, with null sort keys last.
+"""
+
+"""
+The default and largest number of results per page, as in Flask-Restless
+"""
+RESULTS_PER_PAGE = 10
+MAX_RESULTS_PER_PAGE = 100
+
+"""
+The number of filtered counts that are kept
+"""
+COUNT_CACHE_SIZE = 256
+
+
+def encode_cursor(value, key):
+    """
+    Encode the sort key and primary key of a row as an opaque cursor
+    """
+    if isinstance(value, (date, datetime)):
+        value = value.isoformat()
+    return urlsafe_b64encode(json.dumps([value, key]).encode()).decode()
+
+
+def decode_cursor(cursor, column):
+    """
+    Decode a cursor into the sort key and primary key of a row
+    """
+    value, key = json.loads(urlsafe_b64decode(cursor.encode()).decode())
+
+    if value is not None and column.type.python_type is datetime:
+        value = datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%f' if '.' in value
+                                  else '%Y-%m-%dT%H:%M:%S')
+    elif value is not None and column.type.python_type is date:
+        value = datetime.strptime(value, '%Y-%m-%d').date()
+
+    return value, key
+
+
+class KeysetPager ():
+    """
+    A KeysetPager answers grid requests that carry a cursor argument. An empty
+    cursor starts at the first page. The total is computed only when the count
+    argument is set and is cached until the dataset changes.
+    """
+
+    def __init__(self, session, collections):
+        self.session = session
+
+        # collection name => (Model, excluded columns)
+        self.collections = collections
+
+        # (version, collection, filters) => total
+        self.counts = LocalBackend(COUNT_CACHE_SIZE)
+
+    def init_app(self, app, prefix='/v1/grid/'):
+        """
+        Serve cursor requests to the grid endpoints under the prefix
+        """
+
+        @app.before_request
+        def keyset():
+            request = flask.request
+            collection = request.path[len(prefix):].strip('/')
+            if request.method != 'GET' or 'cursor' not in request.args or \
+                    not request.path.startswith(prefix) or \
+                    collection not in self.collections:
+                return None
+
+            try:
+                return flask.jsonify(self.page(collection, request.args))
+            except (AttributeError, KeyError, TypeError, ValueError):
+                return flask.jsonify(message='Unable to construct query'), 400
+
+    def page(self, collection, args):
+        """
+        Return the page of a collection that follows the cursor in args
+        """
+        Model, exclude = self.collections[collection]
+        params = json.loads(args.get('q', '{}'))
+        filters = params.get('filters', [])
+
+        primary = Model.__mapper__.primary_key[0]
+        order = params.get('order_by') or [{'field': primary.name}]
+        if '__' in order[0]['field']:
+            raise ValueError('Keyset pages cannot be sorted by relations')
+        column = getattr(Model, order[0]['field'])
+        descending = order[0].get('direction', 'asc') == 'desc'
+
+        limit = args.get('results_per_page', RESULTS_PER_PAGE, type=int)
+        limit = min(limit if limit > 0 else RESULTS_PER_PAGE, MAX_RESULTS_PER_PAGE)
+
+        def after(lhs, rhs):
+            return lhs < rhs if descending else lhs > rhs
+
+        def ordered(*columns):
+            return [c.desc() if descending else c.asc() for c in columns]
+
+        # Flask-Restless orders by primary key by default
+        query = create_query(self.session, Model, {'filters': filters}) \
+            .order_by(None)
+        value, key = None, None
+        if args['cursor']:
+            value, key = decode_cursor(args['cursor'], column)
+
+        # Rows with a sort key come first, then rows without one
+        rows = []
+        if value is not None or key is None:
+            seek = column != None
+            if value is not None:
+                seek = and_(seek, or_(after(column, value),
+                                      and_(column == value, after(primary, key))))
+            rows = query.filter(seek).order_by(*ordered(column, primary)) \
+                .limit(limit + 1).all()
+
+        if len(rows) <= limit:
+            seek = column == None
+            if value is None and key is not None:
+                seek = and_(seek, after(primary, key))
+            rows += query.filter(seek).order_by(*ordered(primary)) \
+                .limit(limit + 1 - len(rows)).all()
+
+        # Serialize like Flask-Restless
+        relations = frozenset(get_relations(Model)) - frozenset(exclude)
+        deep = dict((relation, {}) for relation in relations)
+        result = {'objects': [to_dict(row, deep, exclude=exclude)
+                              for row in rows[:limit]],
+                  'next_cursor': None}
+
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            result['next_cursor'] = encode_cursor(getattr(last, column.key),
+                                                  getattr(last, primary.key))
+
+        if args.get('count'):
+            count_key = json.dumps([VERSION(), collection, filters], sort_keys=True)
+            count = self.counts.get(count_key)
+            if count is None:
+                count = query.count()
+                self.counts.set(count_key, count)
+            result['num_results'] = count
+
+        return result
@@ -3,6 +3,8 @@
 # Copyright (C) 2018 GameFrame   -
 # --------------------------------
 
+from datetime import datetime
+
 from flask_sqlalchemy import SQLAlchemy
 
 """
@@ -17,15 +19,16 @@ class Game(db.Model):
     One of the three primary models, Game represents a video game.
     """
     __bind_key__ = 'gameframe'
+    __table_args__ = (db.Index('ix_game_c_name', 'c_name', mysql_length=255),)
 
     # The game's GameFrame ID
     game_id = db.Column(db.Integer, primary_key=True)
 
     # The game's Steam AppID
-    steam_id = db.Column(db.Integer)
+    steam_id = db.Column(db.Integer, index=True)
 
     # The game's IGDB ID
-    igdb_id = db.Column(db.Integer)
+    igdb_id = db.Column(db.Integer, index=True)
 
     # The game's external IGDB link
     igdb_link = db.Column(db.Text)
@@ -40,7 +43,7 @@ class Game(db.Model):
     website = db.Column(db.Text)
 
     # The game's first release date
-    release = db.Column(db.Date)
+    release = db.Column(db.Date, index=True)
 
     # The game's cover image
     cover = db.Column(db.Text)
@@ -73,7 +76,7 @@ class Game(db.Model):
     esrb = db.Column(db.Integer)
 
     # Visibility Index
-    vindex = db.Column(db.Integer)
+    vindex = db.Column(db.Integer, index=True)
 
     # Primary developer's name
     developer = db.Column(db.Text)
@@ -133,7 +136,7 @@ class Article(db.Model):
     author = db.Column(db.Text)
 
     # The article's publishing timestamp
-    timestamp = db.Column(db.DateTime)
+    timestamp = db.Column(db.DateTime, index=True)
 
     # The first few sentences of the article
     introduction = db.Column(db.Text)
@@ -165,6 +168,8 @@ class Developer(db.Model):
     of a Game.
     """
     __bind_key__ = 'gameframe'
+    __table_args__ = (db.Index('ix_developer_c_name', 'c_name',
+                               mysql_length=255),)
 
     # The developer's GameFrame ID
     developer_id = db.Column(db.Integer, primary_key=True)
@@ -207,7 +212,7 @@ class Developer(db.Model):
     tweet_count = db.Column(db.Integer)
 
     # Number of games
-    game_count = db.Column(db.Integer)
+    game_count = db.Column(db.Integer, index=True)
 
     # Games
     games = db.relationship('Game', secondary='join_game_developer',
@@ -272,54 +277,170 @@ class Platform(db.Model):
     name = db.Column(db.Text)
 
 
+class PlayerCount(db.Model):
+    """
+    One of the supporting models, PlayerCount is a Steam player count sample
+    of a Game or an hourly or daily rollup of samples.
+    """
+    __bind_key__ = 'gameframe'
+
+    # Resolutions in seconds. Samples have the RAW resolution.
+    RAW = 0
+    HOURLY = 60 * 60
+    DAILY = 24 * 60 * 60
+    ROLLUPS = [HOURLY, DAILY]
+
+    # How long points of each resolution are kept in seconds. Daily rollups
+    # are kept forever.
+    RETENTION = {RAW: 2 * DAILY, HOURLY: 90 * DAILY}
+
+    game_id = db.Column(db.Integer, db.ForeignKey('game.game_id'),
+                        primary_key=True)
+    resolution = db.Column(db.Integer, primary_key=True)
+
+    # The time of the sample or the start of the rollup
+    timestamp = db.Column(db.DateTime, primary_key=True)
+
+    # The number of players, averaged over a rollup
+    players = db.Column(db.Integer)
+
+    # The largest number of players in a rollup
+    peak = db.Column(db.Integer)
+
+
 """
-Join table definitions
+The version rows. The dataset version is bumped whenever the dataset changes.
+The structure version is bumped only when the working set writes or removes
+models and links, so player count updates leave working set snapshots valid.
+"""
+DATASET_VERSION = 1
+STRUCTURE_VERSION = 2
+
+
+class DatasetVersion(db.Model):
+    """
+    A marker that identifies the current state of the dataset or of its
+    structure
+    """
+    __bind_key__ = 'gameframe'
+    version_id = db.Column(db.Integer, primary_key=True)
+
+    # The dataset version number
+    version = db.Column(db.Integer)
+
+    # The time of the last change
+    timestamp = db.Column(db.DateTime)
+
+
+"""
+Join table definitions. The composite primary keys index the first column, so
+only the second column has its own index.
 """
 join_game_genre = db.Table('join_game_genre',
                            db.Column('game_id', db.Integer,
-                                     db.ForeignKey('game.game_id')),
+                                     db.ForeignKey('game.game_id'),
+                                     primary_key=True),
                            db.Column('genre_id', db.Integer,
-                                     db.ForeignKey('genre.genre_id')),
+                                     db.ForeignKey('genre.genre_id'),
+                                     primary_key=True, index=True),
                            info={'bind_key': 'gameframe'})
 
 join_game_platform = db.Table('join_game_platform',
                               db.Column('game_id', db.Integer,
-                                        db.ForeignKey('game.game_id')),
+                                        db.ForeignKey('game.game_id'),
+                                        primary_key=True),
                               db.Column('platform_id', db.Integer,
-                                        db.ForeignKey('platform.platform_id')),
+                                        db.ForeignKey('platform.platform_id'),
+                                        primary_key=True, index=True),
                               info={'bind_key': 'gameframe'})
 
 join_game_article = db.Table('join_game_article',
                              db.Column('game_id', db.Integer,
-                                       db.ForeignKey('game.game_id')),
+                                       db.ForeignKey('game.game_id'),
+                                       primary_key=True),
                              db.Column('article_id', db.Integer,
-                                       db.ForeignKey('article.article_id')),
+                                       db.ForeignKey('article.article_id'),
+                                       primary_key=True, index=True),
                              info={'bind_key': 'gameframe'})
 
 join_game_tweet = db.Table('join_game_tweet',
                            db.Column('game_id', db.Integer,
-                                     db.ForeignKey('game.game_id')),
+                                     db.ForeignKey('game.game_id'),
+                                     primary_key=True),
                            db.Column('tweet_id', db.Integer,
-                                     db.ForeignKey('tweet.tweet_id')),
+                                     db.ForeignKey('tweet.tweet_id'),
+                                     primary_key=True, index=True),
                            info={'bind_key': 'gameframe'})
 
 join_game_video = db.Table('join_game_video',
                            db.Column('game_id', db.Integer,
-                                     db.ForeignKey('game.game_id')),
+                                     db.ForeignKey('game.game_id'),
+                                     primary_key=True),
                            db.Column('video_id', db.Integer,
-                                     db.ForeignKey('video.video_id')),
+                                     db.ForeignKey('video.video_id'),
+                                     primary_key=True, index=True),
                            info={'bind_key': 'gameframe'})
 
 join_game_developer = db.Table('join_game_developer',
                                db.Column('game_id', db.Integer,
-                                         db.ForeignKey('game.game_id')),
+                                         db.ForeignKey('game.game_id'),
+                                         primary_key=True),
                                db.Column('developer_id', db.Integer,
-                                         db.ForeignKey('developer.developer_id')),
+                                         db.ForeignKey('developer.developer_id'),
+                                         primary_key=True, index=True),
                                info={'bind_key': 'gameframe'})
 
 join_article_developer = db.Table('join_article_developer',
                                   db.Column('article_id', db.Integer,
-                                            db.ForeignKey('article.article_id')),
+                                            db.ForeignKey('article.article_id'),
+                                            primary_key=True),
                                   db.Column('developer_id', db.Integer,
-                                            db.ForeignKey('developer.developer_id')),
+                                            db.ForeignKey('developer.developer_id'),
+                                            primary_key=True, index=True),
                                   info={'bind_key': 'gameframe'})
+
+
+def version_table(create=False):
+    """
+    Return the dataset version table or None if it does not exist. Databases
+    from before the dataset version have no such table, so it is created on
+    request.
+    """
+    table = DatasetVersion.__table__
+    connection = db.session.connection(clause=table)
+
+    if create:
+        table.create(bind=connection, checkfirst=True)
+    elif not table.exists(bind=connection):
+        return None
+    return table
+
+
+def get_version(version_id=DATASET_VERSION):
+    """
+    Return the current dataset or structure version or None if there is no
+    such version
+    """
+    table = version_table()
+    if table is None:
+        return None
+
+    return db.session.execute(
+        db.select([table.c.version]).where(table.c.version_id == version_id)).scalar()
+
+
+def bump_version(version_id=DATASET_VERSION):
+    """
+    Increment the dataset or structure version within the current transaction
+    and return the new version. The version table and row are created if they
+    are missing.
+    """
+    table = version_table(create=True)
+
+    # Increment atomically so that concurrent writers never share a version
+    if db.session.execute(table.update().where(table.c.version_id == version_id).values(
+            version=table.c.version + 1, timestamp=datetime.utcnow())).rowcount == 0:
+        db.session.execute(table.insert().values(
+            version_id=version_id, version=1, timestamp=datetime.utcnow()))
+
+    return get_version(version_id)
@@ -0,0 +1,210 @@
+# --------------------------------
+# VINDEX Rank Index              -
+# Copyright (C) 2018 GameFrame   -
+# --------------------------------
+
+from random import random
+
+from sqlalchemy import select
+
+from orm import db, Game
+from version import VersionFollower
+
+"""
+This module keeps the games ordered by VINDEX in memory so that ranks and top
+lists are answered in logarithmic time.
+"""
+
+
+class Node ():
+    """
+    A Treap node
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.priority = random()
+        self.size = 1
+        self.left = None
+        self.right = None
+
+    def update(self):
+        """
+        Recompute the subtree size
+        """
+        self.size = 1 + size(self.left) + size(self.right)
+        return self
+
+
+def size(node):
+    """
+    Return the size of a subtree
+    """
+    return node.size if node is not None else 0
+
+
+def split(node, key):
+    """
+    Split a subtree into the keys less than key and the rest
+    """
+    if node is None:
+        return None, None
+
+    if node.key < key:
+        node.right, right = split(node.right, key)
+        return node.update(), right
+
+    left, node.left = split(node.left, key)
+    return left, node.update()
+
+
+def merge(left, right):
+    """
+    Merge two subtrees where every key of left is less than every key of right
+    """
+    if left is None or right is None:
+        return left if left is not None else right
+
+    if left.priority > right.priority:
+        left.right = merge(left.right, right)
+        return left.update()
+
+    right.left = merge(left, right.left)
+    return right.update()
+
+
+def erase(node, key):
+    """
+    Remove a key from a subtree and return the new subtree
+    """
+    if node is None:
+        return None
+
+    if node.key == key:
+        return merge(node.left, node.right)
+
+    if key < node.key:
+        node.left = erase(node.left, key)
+    else:
+        node.right = erase(node.right, key)
+    return node.update()
+
+
+class Treap ():
+    """
+    A Treap is a randomized balanced search tree that also answers order
+    statistic queries.
+    """
+
+    def __init__(self):
+        self.root = None
+
+    def __len__(self):
+        """
+        Return the number of keys
+        """
+        return size(self.root)
+
+    def insert(self, key):
+        """
+        Insert a key that is not in the tree
+        """
+        left, right = split(self.root, key)
+        self.root = merge(merge(left, Node(key)), right)
+
+    def remove(self, key):
+        """
+        Remove a key if it is in the tree
+        """
+        self.root = erase(self.root, key)
+
+    def rank(self, key):
+        """
+        Return the number of keys less than key
+        """
+        rank = 0
+        node = self.root
+        while node is not None:
+            if node.key < key:
+                rank += size(node.left) + 1
+                node = node.right
+            else:
+                node = node.left
+        return rank
+
+    def first(self, n):
+        """
+        Return the n smallest keys in order
+        """
+        keys = []
+        stack = []
+        node = self.root
+        while len(keys) < n and (node is not None or len(stack) > 0):
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            keys.append(node.key)
+            node = node.right
+        return keys
+
+
+class RankIndex (VersionFollower):
+    """
+    A RankIndex orders the games by descending VINDEX, breaking ties by ID. It
+    follows the dataset version in the background and applies only the VINDEX
+    values that changed.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.treap = Treap()
+
+        # game_id => key in the treap
+        self.keys = {}
+
+    def __len__(self):
+        """
+        Return the number of ranked games
+        """
+        return len(self.treap)
+
+    def load(self):
+        """
+        Read the VINDEX values and apply the changed ones. Only loads write the
+        keys, so the changes are found before taking the lock.
+        """
+        table = Game.__table__
+        keys = {row.game_id: (-row.vindex, row.game_id) for row in
+                db.session.execute(select([table.c.game_id, table.c.vindex])
+                                   .where(table.c.vindex != None))}
+
+        removed = self.keys.keys() - keys.keys()
+        changed = [(game_id, key) for game_id, key in keys.items()
+                   if self.keys.get(game_id) != key]
+
+        with self.lock:
+            for game_id in removed:
+                self.treap.remove(self.keys.pop(game_id))
+
+            for game_id, key in changed:
+                if game_id in self.keys:
+                    self.treap.remove(self.keys[game_id])
+                self.treap.insert(key)
+                self.keys[game_id] = key
+
+    def rank(self, game_id):
+        """
+        Return the 1-based rank of a game or None if it is not ranked
+        """
+        with self.lock:
+            if game_id not in self.keys:
+                return None
+            return self.treap.rank(self.keys[game_id]) + 1
+
+    def top(self, n):
+        """
+        Return the IDs and VINDEX values of the n highest ranked games
+        """
+        with self.lock:
+            return [(game_id, -vindex) for vindex, game_id in self.treap.first(n)]
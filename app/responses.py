@@ -0,0 +1,181 @@
+# --------------------------------
+# API Response Cache             -
+# Copyright (C) 2018 GameFrame   -
+# --------------------------------
+
+from collections import OrderedDict
+from threading import Lock
+import json
+import os
+import pickle
+
+import flask
+
+from version import VERSION, is_excluded, is_stale
+
+"""
+This module caches GET responses of the API. Cache keys include the dataset
+version, so a version bump invalidates every cached response.
+"""
+
+"""
+The number of responses that the local backend keeps
+"""
+CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 1024))
+
+"""
+The URL of a Redis server to share cached responses between workers. The local
+backend is used when it is not set. The redis package is optional and only
+needed when this is set.
+"""
+REDIS_URL = os.environ.get('RESPONSE_CACHE_REDIS')
+
+"""
+The number of seconds that Redis keeps a response. Responses of old dataset
+versions are never read again, so this only bounds their lifetime.
+"""
+REDIS_TTL = 24 * 60 * 60
+
+
+class LocalBackend ():
+    """
+    An in-process LRU cache
+    """
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        Return the value of a key or None
+        """
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """
+        Store a value, evicting the least recently used one if full
+        """
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+class RedisBackend ():
+    """
+    A cache shared through Redis. Size-bounded eviction is left to the server's
+    maxmemory policy (allkeys-lru).
+    """
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RESPONSE_CACHE_REDIS is set but the redis "
+                               "package is not installed (pip install redis)")
+        self.redis = redis.StrictRedis.from_url(url)
+
+    def __len__(self):
+        return self.redis.dbsize()
+
+    def get(self, key):
+        """
+        Return the value of a key or None
+        """
+        value = self.redis.get('response:' + key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value):
+        """
+        Store a value
+        """
+        self.redis.set('response:' + key, pickle.dumps(value), ex=REDIS_TTL)
+
+
+class ResponseCache ():
+    """
+    A ResponseCache answers repeated API GET requests from a backend without
+    reaching the endpoints
+    """
+
+    def __init__(self, backend=None):
+        if backend is None:
+            backend = RedisBackend(REDIS_URL) if REDIS_URL else LocalBackend()
+        self.backend = backend
+
+        # Counters shared by the request threads
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app, prefix='/v1/', exclude=()):
+        """
+        Cache the GET responses of the app under the prefix, except for the
+        excluded paths or URL rules
+        """
+
+        @app.before_request
+        def lookup():
+            request = flask.request
+            if request.method != 'GET' or not request.path.startswith(prefix) \
+                    or is_excluded(exclude):
+                return None
+
+            flask.g.response_key = self.key(request)
+            cached = self.backend.get(flask.g.response_key)
+            with self.lock:
+                if cached is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+            if cached is None:
+                return None
+
+            status, mimetype, body = cached
+            return flask.Response(body, status=status, mimetype=mimetype)
+
+        @app.after_request
+        def store(response):
+            key = flask.g.pop('response_key', None)
+            if key is not None and response.status_code == 200 and \
+                    not response.direct_passthrough and not is_stale():
+                self.backend.set(key, (response.status_code, response.mimetype,
+                                       response.get_data()))
+            return response
+
+    @staticmethod
+    def key(request):
+        """
+        Key a request by dataset version, normalized path, and arguments. The
+        q argument is normalized as JSON.
+        """
+        args = []
+        for name, value in sorted(request.args.items(multi=True)):
+            if name == 'q':
+                try:
+                    value = json.dumps(json.loads(value), sort_keys=True,
+                                       separators=(',', ':'))
+                except ValueError:
+                    pass
+            args.append((name, value))
+
+        return json.dumps([VERSION(), request.path.rstrip('/'), args])
+
+    def stats(self):
+        """
+        Return the hit and miss counters
+        """
+        with self.lock:
+            counters = {'hits': self.hits, 'misses': self.misses}
+        counters['size'] = len(self.backend)
+        return counters
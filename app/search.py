@@ -0,0 +1,130 @@
+# --------------------------------
+# Search Index                   -
+# Copyright (C) 2018 GameFrame   -
+# --------------------------------
+
+from collections import defaultdict
+
+from sqlalchemy import func, select
+
+from orm import (db, Article, Developer, Game, Video, join_game_article,
+                 join_game_developer, join_game_video)
+from version import VersionFollower
+
+"""
+This module keeps a trigram index over the names of games, developers,
+articles, and videos so that substring searches do not scan the tables.
+"""
+
+"""
+The searchable groups: the model, its ID column, the searched column, the
+columns returned with each hit, and the join table that links it to games
+"""
+GROUPS = {
+    'game': (Game, 'game_id', 'name', ['cover'], None),
+    'developer': (Developer, 'developer_id', 'name', ['logo'],
+                  join_game_developer),
+    'article': (Article, 'article_id', 'title', ['cover'], join_game_article),
+    'video': (Video, 'video_id', 'name', ['video_link', 'thumbnail'],
+              join_game_video)
+}
+
+
+def trigrams(text):
+    """
+    Return the set of three character substrings of a text
+    """
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class Group ():
+    """
+    The indexed documents of one model. Documents are stored from the highest
+    to the lowest VINDEX, so hits come out ranked by position.
+    """
+
+    def __init__(self, documents):
+        # [(text, fields)]
+        self.documents = documents
+
+        # trigram => positions of the documents that contain it
+        self.postings = defaultdict(set)
+        for position, (text, _) in enumerate(documents):
+            for trigram in trigrams(text):
+                self.postings[trigram].add(position)
+
+    def search(self, query):
+        """
+        Return the positions of the documents that contain the query
+        """
+        grams = trigrams(query)
+        if len(grams) == 0:
+            candidates = range(len(self.documents))
+        else:
+            postings = sorted((self.postings.get(gram, set()) for gram in grams),
+                              key=len)
+            candidates = sorted(set.intersection(*postings))
+
+        return [position for position in candidates
+                if query in self.documents[position][0]]
+
+
+class SearchIndex (VersionFollower):
+    """
+    A SearchIndex answers name searches over every group from memory. It is
+    rebuilt in the background when the dataset version changes.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.groups = None
+
+    def load(self):
+        """
+        Build every group and swap them in
+        """
+        groups = {name: self.build(*group) for name, group in GROUPS.items()}
+        with self.lock:
+            self.groups = groups
+
+    @staticmethod
+    def build(Model, key, column, fields, join):
+        """
+        Index the searched column of a model. Models other than games rank by
+        the highest VINDEX of their linked games.
+        """
+        table = Model.__table__
+        games = Game.__table__
+        columns = [table.c[key], table.c[column]] + [table.c[f] for f in fields]
+
+        if join is None:
+            score = games.c.vindex
+            query = select(columns + [score])
+        else:
+            score = func.max(games.c.vindex)
+            query = select(columns + [score]) \
+                .select_from(table.outerjoin(join).outerjoin(games)) \
+                .group_by(*columns)
+
+        rows = sorted(db.session.execute(query),
+                      key=lambda row: (-(row[-1] or 0), (row[column] or '').lower()))
+
+        return Group([((row[column] or '').lower(),
+                       dict((name, row[name]) for name in [key, column] + fields))
+                      for row in rows])
+
+    def search(self, query, limit):
+        """
+        Return the number of hits and the best hits of each group
+        """
+        query = query.strip().lower()
+        with self.lock:
+            groups = self.groups
+
+        results = {}
+        for name, group in groups.items():
+            hits = group.search(query)
+            results[name] = {'num_results': len(hits),
+                             'objects': [group.documents[position][1]
+                                         for position in hits[:limit]]}
+        return results
@@ -0,0 +1,194 @@
+# --------------------------------
+# Dataset Version Tracking       -
+# Copyright (C) 2018 GameFrame   -
+# --------------------------------
+
+from threading import Lock, Thread
+import time
+
+import flask
+
+from orm import db, version_table, DATASET_VERSION
+
+"""
+The minimum number of seconds between two dataset version checks
+"""
+CHECK_INTERVAL = 5
+
+
+def mark_stale():
+    """
+    Mark the current request as answered from an outdated in-memory structure
+    """
+    flask.request.environ['gameframe.stale'] = True
+
+
+def is_stale():
+    """
+    Return True if the current request was answered from outdated state
+    """
+    return flask.request.environ.get('gameframe.stale', False)
+
+
+def is_excluded(exclude):
+    """
+    Return True if the path or the URL rule of the current request is in the
+    exclude list
+    """
+    request = flask.request
+    return request.path in exclude or \
+        (request.url_rule is not None and request.url_rule.rule in exclude)
+
+
+class VersionCheck ():
+    """
+    A VersionCheck remembers the dataset version and reads it from the
+    database at most every CHECK_INTERVAL seconds, so that in-memory indexes
+    and caches can follow the dataset cheaply.
+    """
+
+    def __init__(self, interval=CHECK_INTERVAL):
+        self.interval = interval
+        self.lock = Lock()
+        self.version = None
+        self.timestamp = None
+        self.checked = 0
+
+    def __call__(self):
+        """
+        Return the dataset version
+        """
+        return self.check()[0]
+
+    def check(self):
+        """
+        Return the dataset version and the time of its last change
+        """
+        with self.lock:
+            if time.time() - self.checked >= self.interval:
+                table = version_table()
+                row = None
+                if table is not None:
+                    row = db.session.execute(
+                        db.select([table.c.version, table.c.timestamp])
+                        .where(table.c.version_id == DATASET_VERSION)).first()
+                self.version, self.timestamp = row if row is not None else (None, None)
+                self.checked = time.time()
+            return self.version, self.timestamp
+
+    def init_app(self, app, prefix='/v1/', exclude=()):
+        """
+        Add dataset version validators to the GET responses of the app under
+        the prefix and answer matching conditional requests with 304, except
+        for the excluded paths or URL rules whose responses do not follow the
+        dataset
+        """
+
+        def applies():
+            return flask.request.method == 'GET' and \
+                flask.request.path.startswith(prefix) and \
+                not is_excluded(exclude)
+
+        def validate(response, version, timestamp):
+            response.set_etag('gameframe-%d' % version)
+            response.last_modified = timestamp
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+
+        @app.before_request
+        def not_modified():
+            if not applies():
+                return None
+
+            version, timestamp = self.check()
+            if version is None:
+                return None
+
+            request = flask.request
+            if request.if_none_match:
+                unchanged = request.if_none_match.contains('gameframe-%d' % version)
+            elif request.if_modified_since is not None:
+                unchanged = timestamp.replace(microsecond=0) <= \
+                    request.if_modified_since.replace(tzinfo=None)
+            else:
+                unchanged = False
+
+            if unchanged:
+                return validate(flask.Response(status=304), version, timestamp)
+            return None
+
+        @app.after_request
+        def add_validators(response):
+            if applies() and response.status_code == 200 and \
+                    not is_stale():
+                version, timestamp = self.check()
+                if version is not None:
+                    validate(response, version, timestamp)
+            return response
+
+
+"""
+The dataset version shared by the API process
+"""
+VERSION = VersionCheck()
+
+
+class VersionFollower ():
+    """
+    A VersionFollower reloads an in-memory structure when the dataset version
+    changes. The first load runs in the request that needs it. Later reloads
+    run in a background thread while requests keep reading the old state.
+    Such requests are marked stale so that their responses are neither cached
+    nor validated. Subclasses implement load, which must swap in the new state
+    under lock.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.first = Lock()
+        self.version = None
+        self.loaded = False
+        self.loading = False
+
+    def refresh(self):
+        """
+        Load the structure if it was never loaded, or start a background
+        reload if the dataset changed
+        """
+        version = VERSION()
+        if not self.loaded:
+            with self.first:
+                if not self.loaded:
+                    self.load()
+                    self.version = version
+                    self.loaded = True
+            return
+
+        with self.lock:
+            if version == self.version:
+                return
+            mark_stale()
+            if self.loading:
+                return
+            self.loading = True
+
+        app = flask.current_app._get_current_object()
+        Thread(target=self.reload, args=(app, version), daemon=True).start()
+
+    def reload(self, app, version):
+        """
+        Load the structure of the given dataset version outside of a request
+        """
+        try:
+            with app.app_context():
+                self.load()
+            self.version = version
+        finally:
+            with self.lock:
+                self.loading = False
+
+    def load(self):
+        """
+        Read the dataset and swap in the new state
+        """
+        raise NotImplementedError
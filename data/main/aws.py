@@ -3,13 +3,59 @@
 # Copyright (C) 2018 GameFrame   -
 # --------------------------------
 
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+
 import boto3
 from botocore.exceptions import ClientError
+from tqdm import tqdm
+
+from common import PROGRESS_FORMAT
+
+"""
+The S3 endpoint URL. Leave it unset for AWS or point it at an S3-compatible
+server.
+"""
+S3_ENDPOINT = os.environ.get('S3_ENDPOINT')
+
+"""
+The bucket that holds uploaded images
+"""
+S3_BUCKET = os.environ.get('S3_BUCKET', 'gameframe')
+
+"""
+The number of concurrent uploads
+"""
+UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', 16))
 
 """
 The S3 interface
 """
-S3 = boto3.client('s3')
+S3 = boto3.client('s3', endpoint_url=S3_ENDPOINT)
+
+
+def file_md5(filename):
+    """
+    Return the hex MD5 digest of a file, which is the ETag of a single part
+    upload
+    """
+    digest = hashlib.md5()
+    with open(filename, 'rb') as h:
+        digest.update(h.read())
+    return digest.hexdigest()
+
+
+def list_etags(prefix, client=S3):
+    """
+    Return the ETags of every object under the given prefix, listed once
+    """
+    etags = {}
+    for page in client.get_paginator('list_objects_v2').paginate(
+            Bucket=S3_BUCKET, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            etags[obj['Key']] = obj['ETag'].strip('"')
+    return etags
 
 
 def upload_image(image, target):
@@ -19,11 +65,33 @@ def upload_image(image, target):
 
     # Check for existence
     try:
-        S3.head_object(Bucket='gameframe', Key=target)
+        S3.head_object(Bucket=S3_BUCKET, Key=target)
         return
     except ClientError:  # TODO make error more specific if possible
         pass
 
     # Upload
-    S3.upload_file(image, 'gameframe', target,
+    S3.upload_file(image, S3_BUCKET, target,
                    ExtraArgs={'ContentType': 'image/png'})
+
+
+def upload_images(images, prefix, client=S3, workers=UPLOAD_WORKERS):
+    """
+    Upload the given (filename, key) pairs whose keys are missing under the
+    prefix or whose contents differ, using a pool of threads. Returns the
+    uploaded keys.
+    """
+    etags = list_etags(prefix, client)
+    changed = [(image, target) for image, target in images
+               if etags.get(target) != file_md5(image)]
+
+    def upload(job):
+        client.upload_file(job[0], S3_BUCKET, job[1],
+                           ExtraArgs={'ContentType': 'image/png'})
+
+    with ThreadPoolExecutor(workers) as executor:
+        for _ in tqdm(executor.map(upload, changed), '[UPLOAD] Uploading images',
+                      total=len(changed), bar_format=PROGRESS_FORMAT):
+            pass
+
+    return [target for _, target in changed]
@@ -4,19 +4,86 @@
 # --------------------------------
 
 from codecs import open
+from collections import OrderedDict, defaultdict
+from itertools import chain
 from queue import Queue
+from threading import Lock
+import json
+import pickle
 import time
 import os
 
 from multi_key_dict import multi_key_dict
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import make_transient_to_detached
 
 from tqdm import tqdm
 
 import common
-from orm import db, Article, Developer, Game, Video, Tweet, Genre, Platform
+from orm import (db, bump_version, get_version, Article, Developer, Game, Video,
+                 Tweet, Genre, Platform, PlayerCount, join_article_developer,
+                 join_game_article, join_game_developer, join_game_tweet,
+                 join_game_video, STRUCTURE_VERSION)
 from sources.util import dict_delete
 
+"""
+The number of buffered rows that triggers a TableCache checkpoint
+"""
+CHECKPOINT_ROWS = 1000
+
+"""
+The number of seconds after which buffered rows trigger a TableCache checkpoint
+"""
+CHECKPOINT_SECONDS = 60
+
+"""
+The number of rows that a lazy TableCache keeps in memory
+"""
+LRU_SIZE = 10000
+
+"""
+The location of the working set snapshot
+"""
+SNAPSHOT = common.CACHE_GAMEFRAME + '/ws.snapshot'
+
+"""
+The snapshot layout version. Snapshots of any other layout are ignored.
+"""
+SNAPSHOT_FORMAT = 2
+
+"""
+The number of models that WorkingSet.flush writes per commit
+"""
+FLUSH_CHUNK = 1000
+
+"""
+The number of edges that insert_edges writes per statement
+"""
+EDGE_BATCH = 10000
+
+
+def insert_edges(session, table, rows):
+    """
+    Insert rows into a join table in batches, skipping rows that already exist.
+    Returns the number of rows given.
+    """
+    dialect = session.get_bind(clause=table).dialect.name
+    if dialect == 'mysql':
+        statement = table.insert().prefix_with('IGNORE')
+    elif dialect == 'sqlite':
+        statement = table.insert().prefix_with('OR IGNORE')
+    elif dialect == 'postgresql':
+        statement = postgresql.insert(table).on_conflict_do_nothing()
+    else:
+        statement = table.insert()
+
+    rows = list(rows)
+    for i in range(0, len(rows), EDGE_BATCH):
+        session.execute(statement, rows[i:i + EDGE_BATCH])
+
+    return len(rows)
+
 
 class KeyCache():
     """
@@ -29,6 +96,7 @@ class KeyCache():
         """
         self.key_timeout = Model.timeout
 
+        self.lock = Lock()
         self.keys = Queue()
         for k in Model.query:
             # Store a tuple containing the API key and the timestamp of when it
@@ -48,21 +116,22 @@ class KeyCache():
         """
         Advance to the next API key, possibly waiting until it becomes valid
         """
+        with self.lock:
 
-        # Add the current key to the end of the queue with a 20 second
-        # additional timeout
-        self.keys.put((time.time() + self.key_timeout + 20, self.key))
-        self.key = None
+            # Add the current key to the end of the queue with a 20 second
+            # additional timeout
+            self.keys.put((time.time() + self.key_timeout + 20, self.key))
+            self.key = None
 
-        # Get the head of the queue which will always be ready first
-        timestamp, key = self.keys.get()
+            # Get the head of the queue which will always be ready first
+            timestamp, key = self.keys.get()
 
-        # Wait for the key to become valid
-        time.sleep(max(0, timestamp - time.time()))
+            # Wait for the key to become valid
+            time.sleep(max(0, timestamp - time.time()))
 
-        # Setup the new key
-        self.key = key
-        return self.key
+            # Setup the new key
+            self.key = key
+            return self.key
 
 
 class FolderCache ():
@@ -97,58 +166,327 @@ class FolderCache ():
         return os.path.isfile("%s/%s" % (self.location, filename))
 
 
+class Manifest ():
+    """
+    A Manifest is a JSON file on disk that records an entry for each output of
+    a cache, such as the inputs that the output was produced from
+    """
+
+    def __init__(self, location):
+        self.location = location
+        self.entries = {}
+
+        if os.path.isfile(location):
+            with open(location, 'r') as h:
+                self.entries = json.load(h)
+
+    def __contains__(self, key):
+        return str(key) in self.entries
+
+    def get(self, key):
+        """
+        Return the entry for the given key or None
+        """
+        return self.entries.get(str(key))
+
+    def set(self, key, entry):
+        """
+        Replace the entry for the given key
+        """
+        self.entries[str(key)] = entry
+
+    def save(self):
+        """
+        Write the manifest to disk
+        """
+        with open(self.location + '.tmp', 'w') as h:
+            json.dump(self.entries, h)
+        os.replace(self.location + '.tmp', self.location)
+
+
 class TableCache ():
     """
-    A TableCache is a table in the registry that contains raw entities
+    A TableCache is a table in the registry that contains raw entities. A lazy
+    TableCache loads only the key column and fetches rows on demand.
     """
 
-    def __init__(self, Model, key_col):
+    def __init__(self, Model, key_col, lazy=False):
+        self.Model = Model
         self.key_col = key_col
+        self.lazy = lazy
+
+        # The queue of a concurrent collection that owns this TableCache
+        self.queue = None
+
+        # Rows that have not been written to the table yet
+        self.buffer = []
+        self.checkpoints = 0
+        self.checkpoint_time = time.time()
+
+        if lazy:
+            # The set of keys in the table
+            self.keys = set()
+
+            # The most recently used rows
+            self.lru = OrderedDict()
+
+            query = db.session.query(getattr(Model, key_col)).filter(
+                getattr(Model, key_col) != None).yield_per(10000)
+            for key, in tqdm(query, total=query.count(), desc='[CACHE] Loading Keys',
+                             leave=False, bar_format=common.PROGRESS_FORMAT):
+                self.keys.add(key)
+        else:
+            self.load_rows()
+
+    def load_rows(self):
+        """
+        Load every row of the table into memory. A lazy TableCache writes its
+        buffer first and stops being lazy.
+        """
+        self.checkpoint()
         self.models = {}
-        query = Model.query.filter(
-            getattr(Model, key_col) != None).yield_per(1000)
+
+        query = self.Model.query.filter(
+            getattr(self.Model, self.key_col) != None).yield_per(1000)
         for m in tqdm(query, total=query.count(), desc='[CACHE] Loading Table',
                       leave=False, bar_format=common.PROGRESS_FORMAT):
-            self.models[getattr(m, key_col)] = m
+            self.models[getattr(m, self.key_col)] = m
+
+        if self.lazy:
+            self.lazy = False
+            del self.keys
+            del self.lru
 
     def __iter__(self):
         """
         Return an iterator to the rows in the cache
         """
+        if self.lazy:
+            self.checkpoint()
+            return iter(self.Model.query.filter(
+                getattr(self.Model, self.key_col) != None).yield_per(1000))
+
         return iter(self.models.values())
 
     def __len__(self):
         """
         Return the number of rows in this TableCache
         """
+        if self.lazy:
+            return len(self.keys)
+
         return len(self.models)
 
     def add(self, model):
         """
-        Add a row to the table without flushing the database
+        Add a row to the table without flushing the database. During a
+        concurrent collection, the row is queued for the collection's writer.
         """
-        self.models[getattr(model, self.key_col)] = model
-        db.session.add(model)
+        if self.queue is not None:
+            self.queue.put(model)
+            return
+
+        self.store(model)
+
+    def store(self, model):
+        """
+        Buffer a row for the table. The buffer is written once it holds
+        CHECKPOINT_ROWS rows or CHECKPOINT_SECONDS have passed.
+        """
+        key = getattr(model, self.key_col)
+        if self.lazy:
+            self.keys.add(key)
+            self.remember(key, model)
+        else:
+            self.models[key] = model
+        self.buffer.append(model)
+
+        if len(self.buffer) >= CHECKPOINT_ROWS or \
+                time.time() - self.checkpoint_time >= CHECKPOINT_SECONDS:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """
+        Write the buffered rows to the table with bulk inserts. The rows are
+        committed on their own connection so that the session is untouched.
+        """
+        table = self.Model.__table__
+
+        # Rows without a primary key are assigned one by the database
+        keyed = []
+        unkeyed = []
+        for model in self.buffer:
+            row = {c.key: getattr(model, c.key) for c in table.columns}
+            if any(row[c.key] is None for c in table.primary_key):
+                for c in table.primary_key:
+                    del row[c.key]
+                unkeyed.append(row)
+            else:
+                keyed.append(row)
+
+        if keyed or unkeyed:
+            with db.get_engine(bind=self.Model.__bind_key__).begin() as connection:
+                for rows in (keyed, unkeyed):
+                    if rows:
+                        connection.execute(table.insert(), rows)
+
+            self.checkpoints += 1
+            tqdm.write("[CACHE] Checkpoint %d: wrote %d rows" %
+                       (self.checkpoints, len(self.buffer)))
+
+        self.buffer = []
+        self.checkpoint_time = time.time()
 
     def get(self, key):
         """
         Get a row from the database
         """
-        return self.models.get(key)
+        if not self.lazy:
+            return self.models.get(key)
+
+        if key not in self.keys:
+            return None
+
+        if key in self.lru:
+            self.lru.move_to_end(key)
+            return self.lru[key]
+
+        # The row may not have been written yet
+        if self.buffer:
+            self.checkpoint()
+
+        model = self.Model.query.filter(
+            getattr(self.Model, self.key_col) == key).first()
+        self.remember(key, model)
+        return model
+
+    def remember(self, key, model):
+        """
+        Insert a row into the LRU of a lazy TableCache
+        """
+        self.lru[key] = model
+        self.lru.move_to_end(key)
+        if len(self.lru) > LRU_SIZE:
+            self.lru.popitem(last=False)
 
     def exists(self, key):
         """
         Returns True if the given entry exists in the cache
         """
+        if self.lazy:
+            return key in self.keys
+
         return key in self.models
 
     def flush(self):
         """
-        Flush the database connection
+        Flush the database connection. During a concurrent collection, the
+        collection's writer flushes once it finishes.
         """
+        if self.queue is not None:
+            return
+
+        self.checkpoint()
         db.session.commit()
 
 
+class EdgeSet ():
+    """
+    An EdgeSet holds the rows of a join table in memory as pairs of ids. New
+    edges are written to the table in bulk when the working set is flushed.
+    """
+
+    def __init__(self, table, left, right):
+        self.table = table
+
+        # The names of the left and right id columns
+        self.left = left
+        self.right = right
+
+        self.edges = set()
+        self.pending = set()
+
+        # Adjacency in both directions
+        self.rights_of = defaultdict(set)
+        self.lefts_of = defaultdict(set)
+
+    def __iter__(self):
+        """
+        Return an iterator to the edges
+        """
+        return iter(self.edges)
+
+    def __len__(self):
+        """
+        Return the number of edges
+        """
+        return len(self.edges)
+
+    def load(self, edges):
+        """
+        Load edges that already exist in the table
+        """
+        for left, right in edges:
+            self.edges.add((left, right))
+            self.rights_of[left].add(right)
+            self.lefts_of[right].add(left)
+
+    def add(self, left, right):
+        """
+        Add an edge. Returns True if the edge is new.
+        """
+        if (left, right) in self.edges:
+            return False
+
+        self.load([(left, right)])
+        self.pending.add((left, right))
+        return True
+
+    def rights(self, left):
+        """
+        Return the right ids linked to the given left id
+        """
+        return self.rights_of.get(left, frozenset())
+
+    def lefts(self, right):
+        """
+        Return the left ids linked to the given right id
+        """
+        return self.lefts_of.get(right, frozenset())
+
+    def discard_left(self, left):
+        """
+        Remove every edge of the given left id and return the right ids
+        """
+        rights = self.rights_of.pop(left, set())
+        for right in rights:
+            self.edges.discard((left, right))
+            self.pending.discard((left, right))
+            self.lefts_of[right].discard(left)
+        return rights
+
+    def discard_right(self, right):
+        """
+        Remove every edge of the given right id and return the left ids
+        """
+        lefts = self.lefts_of.pop(right, set())
+        for left in lefts:
+            self.edges.discard((left, right))
+            self.pending.discard((left, right))
+            self.rights_of[left].discard(right)
+        return lefts
+
+    def write(self, session):
+        """
+        Insert the pending edges into the table without committing
+        """
+        written = insert_edges(session, self.table,
+                               ({self.left: left, self.right: right}
+                                for left, right in self.pending))
+        self.pending = set()
+        return written
+
+
 class WorkingSet ():
     """
     The working set (WS) is the collection of all entities in the database and
@@ -175,6 +513,9 @@ class WorkingSet ():
         # [igdb_id, name] => Developer
         self.developers = multi_key_dict()
 
+        # [developer_id] => Developer
+        self.developers_id = multi_key_dict()
+
         # [article_id, title] => Article
         self.articles = multi_key_dict()
 
@@ -190,20 +531,37 @@ class WorkingSet ():
         # [platform_id, name] => Platform
         self.platforms = multi_key_dict()
 
-        for game in Game.query.all():
-            self.add_game(game)
+        # Links between models
+        self.game_articles = EdgeSet(join_game_article, 'game_id', 'article_id')
+        self.game_videos = EdgeSet(join_game_video, 'game_id', 'video_id')
+        self.game_tweets = EdgeSet(join_game_tweet, 'game_id', 'tweet_id')
+        self.game_developers = EdgeSet(join_game_developer, 'game_id',
+                                       'developer_id')
+        self.article_developers = EdgeSet(join_article_developer, 'article_id',
+                                          'developer_id')
 
-        for dev in Developer.query.all():
-            self.add_developer(dev)
+        # Models that changed since the last flush
+        self.dirty = set()
 
-        for article in Article.query.all():
-            self.add_article(article)
+        if not self.load_snapshot():
+            for game in Game.query.all():
+                self.add_game(game)
+
+            for dev in Developer.query.all():
+                self.add_developer(dev)
+
+            for article in Article.query.all():
+                self.add_article(article)
+
+            for genre in Genre.query.all():
+                self.add_genre(genre)
 
-        for genre in Genre.query.all():
-            self.add_genre(genre)
+            for platform in Platform.query.all():
+                self.add_platform(platform)
 
-        for platform in Platform.query.all():
-            self.add_platform(platform)
+            for edges, _, _ in self.edge_sets():
+                columns = [edges.table.c[edges.left], edges.table.c[edges.right]]
+                edges.load(self.db.session.execute(db.select(columns)))
 
         count = len(self.games) + len(self.developers) + \
             len(self.articles) + len(self.genres) + len(self.platforms)
@@ -211,6 +569,80 @@ class WorkingSet ():
 
         self.initialized = True
 
+    def edge_sets(self):
+        """
+        Return the EdgeSets with the models on their left and right sides
+        """
+        return [(self.game_articles, Game, Article),
+                (self.game_videos, Game, Video),
+                (self.game_tweets, Game, Tweet),
+                (self.game_developers, Game, Developer),
+                (self.article_developers, Article, Developer)]
+
+    def snapshot_models(self):
+        """
+        Return the models in a snapshot and the functions that add them to the
+        working set
+        """
+        return [(Game, self.add_game), (Developer, self.add_developer),
+                (Article, self.add_article), (Genre, self.add_genre),
+                (Platform, self.add_platform)]
+
+    def load_snapshot(self):
+        """
+        Load the working set from the snapshot if it matches the structure
+        version. Returns True if the snapshot was loaded. A snapshot that does
+        not match, including one of a database without a version, is discarded.
+        Player counts and VINDEX values may be older than in the database, but
+        the working set only writes the fields that it changes.
+        """
+        if not os.path.isfile(SNAPSHOT):
+            return False
+
+        version = get_version(STRUCTURE_VERSION)
+        snapshot = None
+        if version is not None:
+            with open(SNAPSHOT, 'rb') as h:
+                snapshot = pickle.load(h)
+
+        if snapshot is None or snapshot['format'] != SNAPSHOT_FORMAT or \
+                snapshot['version'] != version:
+            print("[MAIN] Discarding outdated snapshot")
+            os.remove(SNAPSHOT)
+            return False
+
+        for Model, add in self.snapshot_models():
+            for row in snapshot[Model.__tablename__]:
+                model = Model(**row)
+
+                # Attach the model as an existing row rather than a new one
+                make_transient_to_detached(model)
+                self.db.session.add(model)
+                add(model)
+
+        for edges, _, _ in self.edge_sets():
+            edges.load(snapshot[edges.table.name])
+
+        print("[MAIN] Loaded snapshot of version %d" % version)
+        return True
+
+    def save_snapshot(self, version):
+        """
+        Write the working set to the snapshot. The rows are read directly from
+        the database so that expired models are not refreshed one at a time.
+        """
+        snapshot = {'format': SNAPSHOT_FORMAT, 'version': version}
+        for Model, _ in self.snapshot_models():
+            snapshot[Model.__tablename__] = [dict(row) for row in
+                                             self.db.session.execute(Model.__table__.select())]
+        for edges, _, _ in self.edge_sets():
+            snapshot[edges.table.name] = list(edges)
+
+        # Replace the old snapshot atomically
+        with open(SNAPSHOT + '.tmp', 'wb') as h:
+            pickle.dump(snapshot, h, pickle.HIGHEST_PROTOCOL)
+        os.replace(SNAPSHOT + '.tmp', SNAPSHOT)
+
     def add_game(self, game):
         """
         Add a game to the working set
@@ -229,6 +661,9 @@ class WorkingSet ():
         dict_delete(self.games_steam, game.steam_id)
         dict_delete(self.games_igdb, game.igdb_id)
 
+        self.dirty.discard(game)
+        self.unlink(game)
+
         try:
             self.db.session.delete(game)
         except InvalidRequestError:
@@ -239,12 +674,17 @@ class WorkingSet ():
         Add a developer to the working set
         """
         self.developers[dev.igdb_id, dev.name, dev.c_name] = dev
+        self.developers_id[dev.developer_id] = dev
 
     def del_developer(self, dev):
         """
         Remove a developer
         """
         dict_delete(self.developers, dev.igdb_id)
+        dict_delete(self.developers_id, dev.developer_id)
+
+        self.dirty.discard(dev)
+        self.unlink(dev)
 
         try:
             self.db.session.delete(dev)
@@ -263,6 +703,9 @@ class WorkingSet ():
         """
         dict_delete(self.articles, article.article_id)
 
+        self.dirty.discard(article)
+        self.unlink(article)
+
         try:
             self.db.session.delete(article)
         except InvalidRequestError:
@@ -292,34 +735,130 @@ class WorkingSet ():
         """
         self.platforms[platform.name, platform.platform_id] = platform
 
-    def flush(self):
-        print("")
-        print("[FLUSH] Flushing working set")
-        for game in self.games.values():
+    def touch(self, *models):
+        """
+        Mark models as changed so that the next flush recounts and writes them
+        """
+        self.dirty.update(models)
+
+    def lookup(self, Model, model_id):
+        """
+        Find a game, developer, or article by its GameFrame ID
+        """
+        if Model is Game:
+            return self.games.get(model_id)
+        if Model is Developer:
+            return self.developers_id.get(model_id)
+        if Model is Article:
+            return self.articles.get(model_id)
+
+        return None
+
+    def link(self, edges, left, right):
+        """
+        Link two models with the given EdgeSet
+        """
+        if edges.add(getattr(left, edges.left), getattr(right, edges.right)):
+            self.touch(left, right)
+
+    def unlink(self, model):
+        """
+        Remove every link of a model and mark its neighbors as changed
+        """
+        for edges, Left, Right in self.edge_sets():
+            if isinstance(model, Left):
+                for right in edges.discard_left(getattr(model, edges.left)):
+                    neighbor = self.lookup(Right, right)
+                    if neighbor is not None:
+                        self.touch(neighbor)
 
-            # Update link counts
-            game.tweet_count = len(game.tweets)
-            game.video_count = len(game.videos)
-            game.article_count = len(game.articles)
-            game.developer_count = len(game.developers)
+            if isinstance(model, Right):
+                for left in edges.discard_right(getattr(model, edges.right)):
+                    neighbor = self.lookup(Left, left)
+                    if neighbor is not None:
+                        self.touch(neighbor)
 
-            # Write
-            self.db.session.add(game)
+    def recount(self, model):
+        """
+        Update the link counts of a game, developer, or article
+        """
+        if isinstance(model, Game):
+            model.tweet_count = len(self.game_tweets.rights(model.game_id))
+            model.video_count = len(self.game_videos.rights(model.game_id))
+            model.article_count = len(self.game_articles.rights(model.game_id))
+            model.developer_count = len(
+                self.game_developers.rights(model.game_id))
+
+        elif isinstance(model, Developer):
+            model.game_count = len(
+                self.game_developers.lefts(model.developer_id))
+            model.article_count = len(
+                self.article_developers.lefts(model.developer_id))
+
+        elif isinstance(model, Article):
+            model.game_count = len(self.game_articles.lefts(model.article_id))
+            model.developer_count = len(
+                self.article_developers.rights(model.article_id))
+
+    def flush(self, full=False):
+        """
+        Commit the working set to the database. Only the models that changed
+        since the last flush are recounted and written unless full is set.
+        """
+        print("")
+        print("[FLUSH] Flushing working set")
+        session = self.db.session()
+
+        if full:
+            dirty = set(chain(self.games.values(), self.developers.values(),
+                              self.articles.values(), self.dirty))
+        else:
+            # Include models whose fields changed through the session
+            dirty = self.dirty.union(m for m in chain(session.new, session.dirty)
+                                     if isinstance(m, (Game, Developer, Article)))
+        dirty.difference_update(session.deleted)
+
+        if not dirty and not session.deleted and \
+                not any(edges.pending for edges, _, _ in self.edge_sets()):
+            print("[FLUSH] Nothing to flush")
+            return
+
+        # Invalidate the snapshot with the first chunk, so that a flush that
+        # stops between chunks never leaves a snapshot that looks current
+        structure = bump_version(STRUCTURE_VERSION)
+
+        # Player counts refer to their games, so they are removed first
+        removed = [m.game_id for m in session.deleted if isinstance(m, Game)]
+        if removed:
+            points = PlayerCount.__table__
+            session.execute(points.delete().where(points.c.game_id.in_(removed)))
+
+        # Keep the working set loaded between chunks
+        session.expire_on_commit = False
+        try:
+            dirty = list(dirty)
+            for i in tqdm(range(0, len(dirty), FLUSH_CHUNK), '[FLUSH] Writing models',
+                          bar_format=common.PROGRESS_FORMAT):
+                for model in dirty[i:i + FLUSH_CHUNK]:
+                    self.recount(model)
 
-        for dev in self.developers.values():
+                    # New models are not in the session until they are written
+                    session.add(model)
 
-            # Update link counts
-            dev.game_count = len(dev.games)
-            dev.article_count = len(dev.articles)
+                session.commit()
 
-        for article in self.articles.values():
+            # Write links once both sides exist
+            links = sum(edges.write(session) for edges, _, _ in self.edge_sets())
 
-            # Update link counts
-            article.game_count = len(article.games)
-            article.developer_count = len(article.developers)
+            version = bump_version()
+            session.commit()
+        finally:
+            session.expire_on_commit = True
 
-        self.db.session.commit()
-        print("[FLUSH] Complete")
+        self.dirty.clear()
+        self.save_snapshot(structure)
+        print("[FLUSH] Wrote %d rows and %d links (version %d)" %
+              (len(dirty), links, version))
 
     def build_game(self, game_id, steam_id, igdb_id, name, c_name):
         """
@@ -343,6 +882,7 @@ class WorkingSet ():
             game = Game(game_id=game_id, steam_id=steam_id,
                         igdb_id=igdb_id, name=name, c_name=c_name)
             self.add_game(game)
+            self.touch(game)
 
         return game
 
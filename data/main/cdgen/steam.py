@@ -6,13 +6,11 @@
 import os
 import sys
 
-from subprocess import call
-
-from collections import defaultdict
-from operator import itemgetter
+import numpy as np
 from wand.image import Image
 from wand.color import Color
 from wand.drawing import Drawing
+from wand.resource import limits
 
 
 """
@@ -46,62 +44,132 @@ The number of pixels to truncate on each side during color average evaluation
 """
 TRUNC = 70
 
+"""
+Overlay images by filename, loaded once per process
+"""
+OVERLAYS = {}
+
+
+def border_colors(rows):
+    """
+    Choose a color for the empty space around each header from the given
+    (headers, pixels, 3) array of top rows. For each row, the colors are
+    ranked by frequency and the result is the frequency-weighted average of
+    the most frequent colors that together cover the top quartile of the
+    pixels. A color that alone covers more than a quarter of the row is
+    returned as is. Returns a list of RGB tuples.
+    """
+    headers, width, _ = rows.shape
+    quartile = width / 4
+
+    # Key every pixel by its row and packed color
+    rows = rows.astype(np.int64)
+    keys = (np.arange(headers)[:, None] << 24) | (rows[:, :, 0] << 16) | \
+        (rows[:, :, 1] << 8) | rows[:, :, 2]
+    keys, counts = np.unique(keys, return_counts=True)
+    header = keys >> 24
+
+    # Rank colors by descending frequency within each row
+    order = np.lexsort((keys, -counts, header))
+    keys, counts, header = keys[order], counts[order], header[order]
+
+    # Keep colors until the row's top quartile is covered
+    preceding = np.cumsum(counts) - counts
+    preceding -= preceding[np.searchsorted(header, header)]
+    keep = preceding <= quartile
+    keys, counts, header = keys[keep], counts[keep], header[keep]
+
+    # Average the kept colors by frequency
+    total = np.bincount(header, counts, headers)
+    return [tuple(int(channel) for channel in color) for color in
+            np.stack([np.bincount(header, ((keys >> shift) & 0xFF) * counts,
+                                  headers) // total
+                      for shift in [16, 8, 0]], axis=1)]
+
 
 def color_average(image):
     """
     Use the topmost row of pixels to choose a good color for the empty space.
     Returns a RGB tuple.
     """
+    return border_colors(top_row(image)[None])[0]
+
+
+def color_averages(filenames):
+    """
+    Choose colors for the empty space of many headers at once. The headers
+    must have the dimensions in HEADER_SIZE. Returns a list of RGB tuples.
+    """
+    rows = []
+    for filename in filenames:
+        with Image(filename=filename) as image:
+            rows.append(top_row(image))
+
+    return border_colors(np.stack(rows))
+
 
+def top_row(image):
+    """
+    Return the topmost row of pixels between the truncated sides as an
+    (pixels, 3) array of RGB values
+    """
     with image.clone() as clone:
         clone.crop(height=1, width=HEADER_SIZE[0] - 2 * TRUNC, left=TRUNC)
-        p = iter(clone.make_blob(format='RGB'))
+        return np.frombuffer(clone.make_blob(format='RGB'),
+                             dtype=np.uint8).reshape(-1, 3)
+
+
+def circular_crop(header):
+    """
+    Make everything outside of the CD's outer circle transparent
+    """
+
+    with Image(width=header.width, height=header.height,
+               background=Color('transparent')) as mask:
+        center = (header.width // 2, header.height // 2 + V_OFFSET)
+        with Drawing() as draw:
+            draw.fill_color = Color('white')
+            draw.circle(center, (center[0] + RADIUS, center[1]))
+            draw(mask)
 
-    color_frequency = defaultdict(int)
-    for rgb in zip(p, p, p):
-        color_frequency[rgb] += 1
+        # Keep the header only where the mask is opaque
+        header.alpha_channel = True
+        header.composite_channel('default_channels', mask, 'dst_in', 0, 0)
 
-    # Sort according to frequency
-    colors = sorted(color_frequency.items(), key=itemgetter(1))
 
-    # If the most common color accounts for more than 25% of the width, return that color
-    if colors[0][1] * 4 > (image.width - TRUNC):
-        return colors[0][0]
+def init_worker():
+    """
+    Prepare a cover generation process. Each process renders with one thread
+    so that a pool of processes does not oversubscribe the cores.
+    """
+    limits['thread'] = 1
 
-    # Otherwise, average the top 25%
-    ave = [0, 0, 0]
-    processed = 0
-    for color in colors:
-        ave[0] += color[0][0] * color[1]
-        ave[1] += color[0][1] * color[1]
-        ave[2] += color[0][2] * color[1]
-        processed += color[1]
-        if processed > (image.width - TRUNC) / 4:
-            break
 
-    return (ave[0] // processed, ave[1] // processed, ave[2] // processed)
+def overlay(filename):
+    """
+    Return an overlay image from the CDGEN source directory
+    """
+    if filename not in OVERLAYS:
+        OVERLAYS[filename] = Image(filename="%s/%s" % (PATH, filename))
+    return OVERLAYS[filename]
 
 
 def generate(file_in, file_out, lin, win, mac):
     """
-    Generate a Steam CD. This function calls a shell script to do the circular
-    crop. TODO: implement circular cropping with Wand for platform independence.
+    Generate a Steam CD
     """
 
-    platform = "%s/platform-%s.png" % (PATH, ('l' if lin else '') +
-                                       ('w' if win else '') + ('m' if mac else ''))
-
-    # Circular crop the header to a temporary file
-    call(["sh", "%s/steam-crop.sh" %
-          PATH, file_in, '/tmp/crop.png', str(RADIUS), str(V_OFFSET)])
+    disc = overlay('disc.png')
 
-    with Image(filename='/tmp/crop.png') as header,                            \
-            Image(filename="%s/disc.png" % PATH) as disc,                      \
+    with Image(filename=file_in) as header,                                    \
             Image(width=disc.width, height=disc.height) as cd:
 
         if not (header.width, header.height) == HEADER_SIZE:
             return
 
+        # Circular crop the header
+        circular_crop(header)
+
         # Compute the best border color
         border = 'rgb' + str(color_average(header))
 
@@ -127,7 +195,10 @@ def generate(file_in, file_out, lin, win, mac):
 
         # Composite platform
         if lin or win or mac:
-            with Drawing() as draw, Image(filename=platform) as plat:
+            plat = overlay("platform-%s.png" % (('l' if lin else '') +
+                                                ('w' if win else '') +
+                                                ('m' if mac else '')))
+            with Drawing() as draw:
                 draw.composite(operator='over', left=(cd.width - plat.width) // 2, top=330,
                                width=plat.width, height=plat.height, image=plat)
                 draw(cd)
@@ -22,6 +22,16 @@ The standard progress bar format
 """
 PROGRESS_FORMAT = "{desc} |{bar}| {n_fmt}/{total_fmt} [{elapsed} elapsed]"
 
+"""
+The number of concurrent request workers for collections that support them
+"""
+COLLECT_WORKERS = int(os.environ.get('COLLECT_WORKERS', 8))
+
+"""
+The number of processes that generate covers
+"""
+COVER_WORKERS = int(os.environ.get('COVER_WORKERS', os.cpu_count()))
+
 """
 Storage for the global TableCaches
 """
@@ -30,15 +40,20 @@ TC = {}
 import cache
 
 
-def load_registry(model, key):
+def load_registry(model, key, lazy=False):
     """
-    Load a TableCache if not already loaded
+    Load a TableCache if not already loaded. A lazy TableCache loads only keys,
+    which is sufficient for existence checks. A lazy TableCache that is already
+    loaded is filled with its rows when a full one is requested.
     """
     model_key = model + '.' + key
 
     if model_key not in TC:
         import registry
-        TC[model_key] = cache.TableCache(eval('registry.Cached' + model), key)
+        TC[model_key] = cache.TableCache(eval('registry.Cached' + model), key,
+                                         lazy)
+    elif not lazy and TC[model_key].lazy:
+        TC[model_key].load_rows()
 
 
 def unload_registry(model, key):
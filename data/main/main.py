@@ -35,6 +35,8 @@ print("-------------------------------------------------------------------------
 print("0. RESET                          Drop all tables and create database schema")
 print("1. REBUILD                        Reset the database and rebuild from the cache")
 print("2. FLUSH                          Commit the working set to the database")
+print("D. MIGRATE                        Create missing tables and indexes")
+print("E. BENCHMARK grid queries         Print query plans and latency of grid queries")
 
 print("")
 print("[REGISTRY]")
@@ -56,6 +58,7 @@ print("G. GATHER articles                Download articles from Steam")
 print("H. COLLECT headers                Download game headers")
 print("I. GENERATE covers                Generate game covers")
 print("J. UPLOAD covers                  Upload game covers to S3")
+print("K. REFRESH headers                Revalidate cached game headers")
 
 print("")
 print("[IGDB]")
@@ -87,7 +90,7 @@ with app.app_context():
 
     import registry
     from sources import igdb, newsapi, steam, google, twitter
-    from util import reset, trim
+    from util import benchmark, migrate, reset, trim
 
     cmd = ""
     while True:
@@ -128,6 +131,10 @@ with app.app_context():
             print("[MAIN] Rebuild completed in %d seconds" % (time() - t))
         elif action == '2':
             WS.flush()
+        elif action == 'd':
+            migrate(db)
+        elif action == 'e':
+            benchmark(db)
 
         elif action == '3':
             registry.merge_games()
@@ -163,6 +170,8 @@ with app.app_context():
             steam.generate_covers()
         elif action == 'j':
             steam.upload_covers()
+        elif action == 'k':
+            steam.collect_headers(refresh=True)
 
         elif action == 'l':
             igdb.collect_games()
@@ -7,7 +7,7 @@ from tqdm import tqdm
 
 from orm import db
 from common import PROGRESS_FORMAT, TC, load_registry, unload_registry
-from sources.util import condition, condition_developer, xappend
+from sources.util import condition, condition_developer
 
 
 class CachedGame(db.Model):
@@ -242,9 +242,10 @@ def merge_articles():
 
         related_game = WS.games.get(article_cached.game_id)
         if related_game is not None:
-            xappend(related_game.articles, article)
-            for developer in related_game.developers:
-                xappend(developer.articles, article)
+            WS.link(WS.game_articles, related_game, article)
+            for developer_id in WS.game_developers.rights(related_game.game_id):
+                WS.link(WS.article_developers, article,
+                        WS.developers_id[developer_id])
 
 
 def merge_videos():
@@ -266,7 +267,7 @@ def merge_videos():
 
         related_game = WS.games.get(video_cached.game_id)
         if related_game is not None:
-            xappend(related_game.videos, video)
+            WS.link(WS.game_videos, related_game, video)
 
     unload_registry('Video', 'video_id')
 
@@ -289,8 +290,9 @@ def merge_tweets():
         twitter.build_tweet(tweet, tweet_data)
 
         related_game = WS.games.get(tweet_cached.game_id)
-        if related_game is not None and len(related_game.tweets) < 75:
-            xappend(related_game.tweets, tweet)
+        if related_game is not None and \
+                len(WS.game_tweets.rights(related_game.game_id)) < 75:
+            WS.link(WS.game_tweets, related_game, tweet)
 
     unload_registry('Tweet', 'tweet_id')
 
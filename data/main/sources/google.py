@@ -4,14 +4,17 @@
 # --------------------------------
 
 import os
+from collections import defaultdict
 from datetime import datetime
 
 import requests
+from tqdm import tqdm
 
 from cache import WS, KeyCache, load_working_set
 from common import TC, load_registry
 from registry import KeyGoogle, CachedVideo
-from sources.util import condition_heavy, generic_gather, vstrlen, xappend
+from sources.util import (KeywordAutomaton, condition_heavy, generic_gather,
+                          vstrlen)
 
 """
 The API key cache
@@ -128,7 +131,7 @@ def gather_videos():
     Download videos from YouTube by game
     """
     load_working_set()
-    load_registry('Video', 'game_id')
+    load_registry('Video', 'game_id', lazy=True)
 
     generic_gather(rq_videos, TC['Video.game_id'], '[GATHER] Downloading Videos',
                    [game for game in WS.games.values() if not
@@ -138,17 +141,20 @@ def gather_videos():
 def link_videos():
     """
     Compute Game-Video links.
-    Complexity: O(N^2)
+    Complexity: O(N) in the total length of the videos
     """
     load_working_set()
 
+    games = defaultdict(list)
+    for game in WS.games.values():
+        games[condition_heavy(game.c_name)].append(game)
+    automaton = KeywordAutomaton(games.keys())
+
     videos = {condition_heavy(video.name + video.description): video
               for video in WS.videos.values()}
 
-    for game in tqdm(WS.games.values(), '[LINK] Linking Videos'):
-        name = condition_heavy(game.c_name)
-
-        for text in videos.keys():
-            if name in text:
+    for text in tqdm(videos.keys(), '[LINK] Linking Videos'):
+        for name in automaton.search(text):
+            for game in games[name]:
                 # Link the models
-                xappend(game.videos, videos[text])
+                WS.link(WS.game_videos, game, videos[text])
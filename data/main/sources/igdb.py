@@ -13,8 +13,8 @@ from cache import WS, KeyCache, load_working_set
 from orm import Developer, Game, Genre, Platform
 from common import PROGRESS_FORMAT, TC, load_registry
 from registry import KeyIgdb, CachedGame, CachedDeveloper
-from sources.util import (condition, condition_developer,
-                          generic_collect, url_normalize, vstrlen, xappend)
+from sources.util import (condition, condition_developer, generic_collect,
+                          plan_strides, url_normalize, vstrlen, xappend)
 
 """
 The API key cache
@@ -226,22 +226,32 @@ def collect_games():
     """
     Download missing games from IGDB.
     """
-    load_registry('Game', 'igdb_id')
+    load_registry('Game', 'igdb_id', lazy=True)
+
+    missing = [igdb_id for igdb_id in GAME_RANGE if not
+               TC['Game.igdb_id'].exists(igdb_id)]
+    plan = plan_strides(missing, API_STRIDE)
+    print("[COLLECT] %d missing games require %d requests" %
+          (len(missing), len(plan)))
 
     generic_collect(rq_games, TC['Game.igdb_id'], '[COLLECT] Downloading Games',
-                    [igdb_id for igdb_id in GAME_RANGE if not
-                     TC['Game.igdb_id'].exists(igdb_id)])
+                    plan)
 
 
 def collect_developers():
     """
     Download missing developers from IGDB.
     """
-    load_registry('Developer', 'igdb_id')
+    load_registry('Developer', 'igdb_id', lazy=True)
+
+    missing = [igdb_id for igdb_id in DEV_RANGE if not
+               TC['Developer.igdb_id'].exists(igdb_id)]
+    plan = plan_strides(missing, API_STRIDE)
+    print("[COLLECT] %d missing developers require %d requests" %
+          (len(missing), len(plan)))
 
     generic_collect(rq_developers, TC['Developer.igdb_id'], '[COLLECT] Downloading Developers',
-                    [igdb_id for igdb_id in DEV_RANGE if not
-                     TC['Developer.igdb_id'].exists(igdb_id)])
+                    plan)
 
 
 def link_developers():
@@ -264,4 +274,4 @@ def link_developers():
                     game.developer = developer.name
 
                 # Link the models
-                xappend(developer.games, game)
+                WS.link(WS.game_developers, game, developer)
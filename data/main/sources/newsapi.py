@@ -12,8 +12,8 @@ from tqdm import tqdm
 from cache import WS, KeyCache, load_working_set
 from common import TC, load_registry
 from registry import KeyNewsapi, CachedArticle
-from sources.util import (condition, condition_heavy,
-                          generic_gather, url_normalize, vstrlen, xappend)
+from sources.util import (KeywordAutomaton, condition, condition_heavy,
+                          generic_gather, url_normalize, vstrlen)
 
 
 """
@@ -190,7 +190,7 @@ def gather_articles():
     Search for articles related to games and download them to the cache
     """
     load_working_set()
-    load_registry('Article', 'game_id')
+    load_registry('Article', 'game_id', lazy=True)
 
     generic_gather(rq_articles, TC['Article.game_id'], '[GATHER] Downloading Articles',
                    [game for game in WS.games.values() if not
@@ -200,16 +200,16 @@ def gather_articles():
 def link_articles():
     """
     Compute Game-Article links.
-    Complexity: O(N^2)
+    Complexity: O(N) in the total length of the articles
     """
     load_working_set()
 
     games = {condition_heavy(game.c_name): game for game in WS.games.values()}
+    automaton = KeywordAutomaton(games.keys())
 
     for article in tqdm(WS.articles.values(), '[LINK] Linking Articles'):
         content = condition_heavy(article.introduction)
 
-        for name in games.keys():
-            if name in content:
-                # Link the models
-                xappend(article.games, games[name])
+        for name in automaton.search(content):
+            # Link the models
+            WS.link(WS.game_articles, games[name], article)
@@ -3,19 +3,24 @@
 # Copyright (C) 2018 GameFrame   -
 # --------------------------------
 
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import re
 from functools import lru_cache
 from itertools import chain
+from multiprocessing import Pool
+from time import time
 
 import requests
 from ratelimit import rate_limited
 from datetime import datetime
 from tqdm import tqdm
 
-from aws import upload_image
-from cache import WS, FolderCache, load_working_set
-from cdgen.steam import generate
-from common import CACHE_GAMEFRAME, CDN_URI, PROGRESS_FORMAT, TC, load_registry
+from aws import upload_images
+from cache import WS, FolderCache, Manifest, load_working_set
+from cdgen.steam import generate, init_worker
+from common import (CACHE_GAMEFRAME, CDN_URI, COLLECT_WORKERS, COVER_WORKERS,
+                    PROGRESS_FORMAT, TC, load_registry)
 from orm import Game, Article, Genre, Platform
 from registry import CachedGame, CachedArticle
 from sources.util import (condition, condition_developer, condition_heavy,
@@ -32,6 +37,16 @@ The CD image cache
 """
 CACHE_CD = FolderCache(CACHE_GAMEFRAME + "/steam/cds")
 
+"""
+The validators of each cached header
+"""
+MANIFEST_HEADER = Manifest(CACHE_GAMEFRAME + "/steam/headers.json")
+
+"""
+The inputs of each generated CD
+"""
+MANIFEST_CD = Manifest(CACHE_GAMEFRAME + "/steam/cds.json")
+
 
 """
 Steam genres that should be filtered out
@@ -110,9 +125,9 @@ def rq_articles(game):
     assert rq.status_code == requests.codes.ok
     for article_json in rq.json()['appnews']['newsitems']:
         TC['Article.game_id'].add(
-            CachedGame(game_id=game.game_id,
-                       steam_data=article_json
-                       if validate_article(article_json) else None))
+            CachedArticle(game_id=game.game_id,
+                          steam_data=article_json
+                          if validate_article(article_json) else None))
 
 
 def build_game(game, game_json):
@@ -291,11 +306,11 @@ def collect_games():
     Download missing games from Steam
     """
     apps = rq_app_list()
-    load_registry('Game', 'steam_id')
+    load_registry('Game', 'steam_id', lazy=True)
 
     generic_collect(rq_game, TC['Game.steam_id'], '[COLLECT] Downloading Games',
                     [app['appid'] for app in apps if not
-                     TC['Game.steam_id'].exists(app['appid'])])
+                     TC['Game.steam_id'].exists(app['appid'])], COLLECT_WORKERS)
 
 
 def collect_articles():
@@ -303,28 +318,68 @@ def collect_articles():
     Download missing articles from Steam
     """
     load_working_set()
-    load_registry('Article', 'game_id')
+    load_registry('Article', 'game_id', lazy=True)
 
     generic_collect(rq_articles, TC['Article.game_id'], '[COLLECT] Downloading Articles',
                     [game for game in WS.games_steam.values() if not
-                     TC['Article.game_id'].exists(game.game_id)])
+                     TC['Article.game_id'].exists(game.game_id)], COLLECT_WORKERS)
 
 
-def collect_headers():
+def collect_headers(refresh=False):
     """
-    Download missing game headers from Steam
+    Download missing game headers from Steam. A refresh also revalidates the
+    cached headers with conditional requests.
     """
     load_working_set()
 
-    for game in tqdm(WS.games_steam.values(), '[COLLECT] Downloading headers',
-                     bar_format=PROGRESS_FORMAT):
-        appid = game.steam_id
-        if game.steam_header is not None and not CACHE_HEADER.exists(appid):
-            rq = requests.get(game.steam_header)
-
-            if rq.status_code == requests.codes.ok:
+    headers = [(game.steam_id, game.steam_header)
+               for game in WS.games_steam.values()
+               if game.steam_header is not None and
+               (refresh or not CACHE_HEADER.exists(str(game.steam_id)))]
+
+    # Reuse connections across requests
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=COLLECT_WORKERS)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    def download(header):
+        appid, url = header
+
+        # Ask for the header only if it changed
+        conditions = {}
+        entry = MANIFEST_HEADER.get(appid)
+        if entry is not None and CACHE_HEADER.exists(str(appid)):
+            if entry.get('etag') is not None:
+                conditions['If-None-Match'] = entry['etag']
+            if entry.get('last_modified') is not None:
+                conditions['If-Modified-Since'] = entry['last_modified']
+
+        try:
+            return appid, session.get(url, headers=conditions, timeout=30)
+        except requests.exceptions.RequestException:
+            return appid, None
+
+    downloaded, unchanged, failed = 0, 0, 0
+    with ThreadPoolExecutor(COLLECT_WORKERS) as executor:
+        for appid, rq in tqdm(executor.map(download, headers),
+                              '[COLLECT] Downloading headers', total=len(headers),
+                              bar_format=PROGRESS_FORMAT):
+            if rq is not None and rq.status_code == requests.codes.not_modified:
+                unchanged += 1
+            elif rq is not None and rq.status_code == requests.codes.ok:
                 # Write the header to cache
-                CACHE_HEADER.write(appid, rq.content)
+                CACHE_HEADER.write(str(appid), rq.content)
+                MANIFEST_HEADER.set(appid, {
+                    'etag': rq.headers.get('ETag'),
+                    'last_modified': rq.headers.get('Last-Modified')})
+                downloaded += 1
+            else:
+                failed += 1
+
+    MANIFEST_HEADER.save()
+    print("[COLLECT] Downloaded %d headers, %d unchanged, %d failed" %
+          (downloaded, unchanged, failed))
 
 
 def generate_covers():
@@ -337,13 +392,80 @@ def generate_covers():
     WIN = WS.platforms[6]
     MAC = WS.platforms[14]
 
-    for game in tqdm(WS.games_steam.values(), '[GENERATE] Generating covers',
-                     bar_format=PROGRESS_FORMAT):
+    # Skip games whose cover exists and was generated from the same inputs
+    jobs = []
+    digests = {}
+    for game in WS.games_steam.values():
         appid = game.steam_id
-        if not CACHE_CD.exists(str(appid) + '.png') and CACHE_HEADER.exists(appid):
-            generate("%s/%d" % (CACHE_HEADER, appid), "%s/%s" %
-                     (CACHE_CD, str(appid) + '.png'),
-                     LIN in game.platforms, WIN in game.platforms, MAC in game.platforms)
+        if not CACHE_HEADER.exists(str(appid)):
+            continue
+
+        lin, win, mac = LIN in game.platforms, WIN in game.platforms, \
+            MAC in game.platforms
+        digests[appid] = cover_digest(appid, lin, win, mac)
+
+        entry = MANIFEST_CD.get(appid)
+        if not CACHE_CD.exists(str(appid) + '.png') or entry is None or \
+                entry['digest'] != digests[appid]:
+            jobs.append((appid, "%s/%d" % (CACHE_HEADER, appid),
+                         "%s/%d.png" % (CACHE_CD, appid), lin, win, mac))
+    print("[GENERATE] Generating %d covers with %d processes" %
+          (len(jobs), COVER_WORKERS))
+
+    timings = []
+    failures = []
+    t = time()
+    with Pool(COVER_WORKERS, initializer=init_worker) as pool:
+        for appid, seconds, error in tqdm(pool.imap_unordered(generate_cover, jobs),
+                                          '[GENERATE] Generating covers',
+                                          total=len(jobs),
+                                          bar_format=PROGRESS_FORMAT):
+            timings.append((seconds, appid))
+            if error is not None:
+                failures.append(appid)
+                tqdm.write("[GENERATE] Failed %d: %s" % (appid, error))
+            else:
+                entry = MANIFEST_CD.get(appid) or {}
+                entry['digest'] = digests[appid]
+                MANIFEST_CD.set(appid, entry)
+
+    MANIFEST_CD.save()
+
+    if len(timings) > 0:
+        timings.sort(reverse=True)
+        print("[GENERATE] Generated %d covers in %d seconds (%d failed)" %
+              (len(timings) - len(failures), time() - t, len(failures)))
+        print("[GENERATE] Average %.2f seconds per cover, slowest: %s" %
+              (sum(seconds for seconds, _ in timings) / len(timings),
+               ", ".join("%d (%.2fs)" % (appid, seconds)
+                         for seconds, appid in timings[:5])))
+
+
+def cover_digest(appid, lin, win, mac):
+    """
+    Return a hash of the inputs of a cover: the header and the platform flags
+    """
+    digest = hashlib.sha1()
+    with open("%s/%d" % (CACHE_HEADER, appid), 'rb') as h:
+        digest.update(h.read())
+    digest.update(bytes([lin, win, mac]))
+    return digest.hexdigest()
+
+
+def generate_cover(job):
+    """
+    Generate one cover in a worker process. Returns the AppID, the time taken,
+    and the error if generation failed.
+    """
+    appid, file_in, file_out, lin, win, mac = job
+
+    t = time()
+    try:
+        generate(file_in, file_out, lin, win, mac)
+    except Exception as e:
+        return appid, time() - t, repr(e)
+
+    return appid, time() - t, None
 
 
 def upload_covers():
@@ -352,12 +474,13 @@ def upload_covers():
     """
     load_working_set()
 
-    for game in tqdm(WS.games_steam.values(), '[UPLOAD] Uploading covers'):
-        appid = game.steam_id
-        if CACHE_CD.exists(str(appid) + '.png'):
-            # Upload cover
-            upload_image("%s/%d.png" % (CACHE_CD, appid),
-                         "cover/steam/%d.png" % appid)
+    # Only missing or changed covers are uploaded
+    covers = [("%s/%d.png" % (CACHE_CD, game.steam_id),
+               "cover/steam/%d.png" % game.steam_id)
+              for game in WS.games_steam.values()
+              if CACHE_CD.exists(str(game.steam_id) + '.png')]
+    uploaded = upload_images(covers, 'cover/steam/')
+    print("[UPLOAD] Uploaded %d of %d covers" % (len(uploaded), len(covers)))
 
 
 def link_developers():
@@ -385,4 +508,4 @@ def link_developers():
                     game.developer = name
 
                 # Link the models
-                xappend(game.developers, dev)
+                WS.link(WS.game_developers, game, dev)
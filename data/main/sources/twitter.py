@@ -3,6 +3,7 @@
 # Copyright (C) 2018 GameFrame   -
 # --------------------------------
 
+from collections import defaultdict
 from datetime import datetime
 
 from TwitterSearch import TwitterSearch, TwitterSearchOrder, TwitterSearchException
@@ -12,7 +13,8 @@ from cache import WS, KeyCache, load_working_set
 from common import TC, load_registry
 from orm import Game, Tweet
 from registry import KeyTwitter, CachedTweet
-from sources.util import condition_heavy, dict_delete, generic_gather, vstrlen
+from sources.util import (KeywordAutomaton, condition_heavy, dict_delete,
+                          generic_gather, vstrlen)
 
 """
 The API key cache
@@ -125,7 +127,7 @@ def gather_tweets():
     Search for tweets related to games and download them to the cache
     """
     load_working_set()
-    load_registry('Tweet', 'game_id')
+    load_registry('Tweet', 'game_id', lazy=True)
 
     generic_gather(rq_tweets, TC['Tweet.game_id'], '[GATHER] Downloading Tweets',
                    [game for game in WS.games.values() if not
@@ -135,17 +137,20 @@ def gather_tweets():
 def link_tweets():
     """
     Compute Game-Tweet links.
-    Complexity: O(N^2)
+    Complexity: O(N) in the total length of the tweets
     """
     load_working_set()
 
+    games = defaultdict(list)
+    for game in WS.games.values():
+        games[condition_heavy(game.c_name)].append(game)
+    automaton = KeywordAutomaton(games.keys())
+
     tweets = {condition_heavy(tweet.content): tweet
               for tweet in WS.tweets.values()}
 
-    for game in tqdm(WS.games.values(), '[LINK] Linking Tweets'):
-        name = condition_heavy(game.c_name)
-
-        for text in tweets.keys():
-            if name in text:
+    for text in tqdm(tweets.keys(), '[LINK] Linking Tweets'):
+        for name in automaton.search(text):
+            for game in games[name]:
                 # Link the models
-                xappend(game.tweets, tweets[text])
+                WS.link(WS.game_tweets, game, tweets[text])
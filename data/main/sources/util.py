@@ -5,8 +5,11 @@
 
 import re
 
+from collections import deque
 from datetime import datetime
+from queue import Queue
 from random import shuffle
+from threading import Event, Lock, Thread
 
 from tqdm import tqdm
 
@@ -30,6 +33,72 @@ A compiled regex that performs heavy conditioning
 """
 CONDITION_HEAVY = re.compile(r'<sup>|</sup>|[ ]|\W')
 
+"""
+The maximum number of rows that a concurrent collection buffers for its writer
+"""
+QUEUE_SIZE = 1000
+
+
+def concurrent_collect(rq_func, cache, desc: str, domain, workers: int):
+    """
+    Perform a collection with a pool of request workers. Rows that the workers
+    add to the TableCache pass through a bounded queue to the calling thread,
+    which is the only thread that writes to the TableCache.
+
+    Rate limits on the request function are shared by all workers.
+    """
+    rows = Queue(maxsize=QUEUE_SIZE)
+    items = iter(domain)
+    lock = Lock()
+    stop = Event()
+    errors = []
+
+    # Markers for a completed request and an exited worker
+    done = object()
+    finished = object()
+
+    def work():
+        try:
+            while not stop.is_set():
+                with lock:
+                    d = next(items, finished)
+                if d is finished:
+                    break
+
+                rq_func(d)
+                rows.put(done)
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            rows.put(finished)
+
+    cache.queue = rows
+    for _ in range(workers):
+        Thread(target=work, daemon=True).start()
+
+    live = workers
+    try:
+        with tqdm(total=len(domain), desc=desc, bar_format=PROGRESS_FORMAT) as progress:
+            while live:
+                row = rows.get()
+                if row is done:
+                    progress.update()
+                elif row is finished:
+                    live -= 1
+                else:
+                    cache.store(row)
+    finally:
+        # Discard whatever remains if the writer failed
+        stop.set()
+        while live:
+            if rows.get() is finished:
+                live -= 1
+        cache.queue = None
+
+    if errors:
+        raise errors[0]
+
 
 def condition(keyword: str):
     """
@@ -76,25 +145,29 @@ def dict_delete(dict, key):
         pass
 
 
-def generic_collect(rq_func, cache, desc: str, domain):
+def generic_collect(rq_func, cache, desc: str, domain, workers: int = 1):
     """
     Perform a generic collection with the given request function, gather domain,
-    and TableCache.
+    and TableCache. If more than one worker is requested, the collection is
+    performed concurrently.
     """
     try:
-        for d in tqdm(domain, desc=desc, bar_format=PROGRESS_FORMAT):
-            rq_func(d)
+        if workers > 1:
+            concurrent_collect(rq_func, cache, desc, domain, workers)
+        else:
+            for d in tqdm(domain, desc=desc, bar_format=PROGRESS_FORMAT):
+                rq_func(d)
     finally:
         cache.flush()
 
 
-def generic_gather(rq_func, cache, desc: str, domain):
+def generic_gather(rq_func, cache, desc: str, domain, workers: int = 1):
     """
     Perform a generic gather with the given request function, gather domain,
     and TableCache. The domain is shuffled before gathering.
     """
     shuffle(domain)
-    generic_collect(rq_func, cache, desc, domain)
+    generic_collect(rq_func, cache, desc, domain, workers)
 
 
 def keywordize(game):
@@ -104,6 +177,78 @@ def keywordize(game):
     return condition(game.name)
 
 
+class KeywordAutomaton():
+    """
+    A KeywordAutomaton (Aho-Corasick) finds every occurrence of many keywords in
+    a text with a single pass over that text
+    """
+
+    def __init__(self, keywords):
+        """
+        Compile the given keywords into a single automaton
+        """
+        self.keywords = []
+
+        # The trie transitions, failure links, and matched keyword indices of
+        # each state. State 0 is the root.
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+
+        indices = {}
+        for keyword in keywords:
+            if keyword in indices:
+                continue
+            indices[keyword] = len(self.keywords)
+            self.keywords.append(keyword)
+
+            state = 0
+            for c in keyword:
+                if c not in self.goto[state]:
+                    self.goto[state][c] = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = self.goto[state][c]
+            self.output[state].append(indices[keyword])
+
+        # Compute failure links breadth-first
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for c, child in self.goto[state].items():
+                queue.append(child)
+
+                fail = self.fail[state]
+                while fail and c not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[child] = self.goto[fail].get(c, 0)
+
+                # Inherit the matches of the failure state
+                self.output[child] = self.output[child] + \
+                    self.output[self.fail[child]]
+
+    def search(self, text: str):
+        """
+        Return the keywords that occur in the given text in the order they were
+        compiled
+        """
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+
+        found = set(output[0])
+        state = 0
+        for c in text:
+            while state and c not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(c, 0)
+            if output[state]:
+                found.update(output[state])
+
+        return [self.keywords[i] for i in sorted(found)]
+
+
 def parse_steam_date(steam_date: str):
     """
     Parse a textual release date from Steam.
@@ -120,6 +265,21 @@ def parse_steam_date(steam_date: str):
     return None
 
 
+def plan_strides(ids, stride: int):
+    """
+    Reduce a collection of ids to the smallest list of starting ids such that
+    the non-overlapping blocks [start, start + stride) cover every id.
+    """
+    plan = []
+    end = None
+    for i in sorted(ids):
+        if end is None or i >= end:
+            plan.append(i)
+            end = i + stride
+
+    return plan
+
+
 def url_normalize(url: str):
     """
     Convert a URL into the standard format
@@ -0,0 +1,85 @@
+# --------------------------------
+# GameFrame Dataset Statistics   -
+# Copyright (C) 2018 GameFrame   -
+# --------------------------------
+
+from collections import Counter
+
+
+class Distribution ():
+    """
+    A Distribution tracks one value per key and answers order statistics
+    exactly. Values are counted by occurrence, so updates take constant time
+    and queries take time linear in the number of distinct values.
+    """
+
+    def __init__(self):
+        # key => value
+        self.values = {}
+
+        # value => number of keys with that value
+        self.counts = Counter()
+
+        self.total = 0
+
+    def __len__(self):
+        """
+        Return the number of keys
+        """
+        return len(self.values)
+
+    def update(self, key, value):
+        """
+        Set the value of a key, replacing its previous value
+        """
+        self.remove(key)
+
+        self.values[key] = value
+        self.counts[value] += 1
+        self.total += value
+
+    def remove(self, key):
+        """
+        Remove a key if it is present
+        """
+        if key not in self.values:
+            return
+
+        value = self.values.pop(key)
+        self.counts[value] -= 1
+        if self.counts[value] == 0:
+            del self.counts[value]
+        self.total -= value
+
+    def percentile(self, p):
+        """
+        Return the value below which p percent of the values fall, or 0 if the
+        distribution is empty. The 50th percentile is the upper median and the
+        100th percentile is the maximum.
+        """
+        if len(self.values) == 0:
+            return 0
+
+        rank = min(int(p / 100 * len(self.values)), len(self.values) - 1)
+        for value in sorted(self.counts):
+            rank -= self.counts[value]
+            if rank < 0:
+                return value
+
+    def max(self):
+        """
+        Return the largest value
+        """
+        return max(self.counts, default=0)
+
+    def mean(self):
+        """
+        Return the average value
+        """
+        return self.total / len(self.values) if len(self.values) > 0 else 0
+
+    def median(self):
+        """
+        Return the upper median value
+        """
+        return self.percentile(50)
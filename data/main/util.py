@@ -3,15 +3,19 @@
 # Copyright (C) 2018 GameFrame   -
 # --------------------------------
 
+from datetime import date
+from statistics import median
+from time import time
 import os
 import sys
 
+from sqlalchemy import inspect, select
 from tqdm import tqdm
 
 from aws import upload_image
-from cache import WS, reload_working_set
+from cache import WS, insert_edges, reload_working_set
 from common import PROGRESS_FORMAT
-from orm import Genre, Platform
+from orm import Article, Developer, Game, Genre, Platform, join_game_developer
 from sources import igdb, newsapi, steam
 from sources.util import vstrlen
 
@@ -26,7 +30,7 @@ def trim():
     for dev in tqdm(list(WS.developers.values()), '[TRIM] Scanning Developers',
                     bar_format=PROGRESS_FORMAT):
         if not vstrlen(dev.logo, 10) or not vstrlen(dev.logo, 10) \
-                or len(dev.games) == 0:
+                or not WS.game_developers.lefts(dev.developer_id):
             WS.del_developer(dev)
             assert dev.name not in WS.developers
 
@@ -35,12 +39,147 @@ def trim():
     for game in tqdm(list(WS.games.values()), '[TRIM] Scanning Games',
                      bar_format=PROGRESS_FORMAT):
         if not vstrlen(game.cover, 5) or game.screenshots is None \
-                or not vstrlen(game.summary, 15) or len(game.developers) == 0 \
-                or (len(game.articles) == 0 and len(game.videos) == 0):
+                or not vstrlen(game.summary, 15) \
+                or not WS.game_developers.rights(game.game_id) \
+                or (not WS.game_articles.rights(game.game_id)
+                    and not WS.game_videos.rights(game.game_id)):
             WS.del_game(game)
             assert game.name not in WS.games
 
 
+"""
+The number of models on a frontend grid page
+"""
+GRID_PAGE_SIZE = 30
+
+"""
+The number of timed runs of each benchmarked query
+"""
+BENCHMARK_RUNS = 20
+
+
+def grid_queries(session):
+    """
+    Return the grid and relation queries that the frontend sends by name, as
+    Flask-Restless builds them for the first page
+    """
+    games = session.query(Game)
+    recent = date(date.today().year - 3, 1, 1)
+    return {
+        'games by vindex': games.order_by(Game.vindex.desc()),
+        'games by release': games.order_by(Game.release.desc()),
+        'recent games': games.filter(Game.release >= recent)
+                             .order_by(Game.vindex.desc()),
+        'games over vindex': games.filter(Game.vindex >= 50)
+                                  .order_by(Game.vindex.desc()),
+        'games of genre': games.filter(Game.genres.any(genre_id=1))
+                               .order_by(Game.vindex.desc()),
+        'games of developer': games.join(join_game_developer)
+                                   .filter(join_game_developer.c.developer_id == 1)
+                                   .order_by(Game.vindex.desc()),
+        'developers by games': session.query(Developer)
+                                      .order_by(Developer.game_count.desc()),
+        'articles by date': session.query(Article)
+                                   .order_by(Article.timestamp.desc())
+    }
+
+
+def explain(engine, query):
+    """
+    Return the query plan of a query as lines of text
+    """
+    compiled = query.statement.compile(dialect=engine.dialect)
+    params = compiled.params
+    if compiled.positional:
+        params = [params[name] for name in compiled.positiontup]
+
+    prefix = 'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    return [' | '.join(str(column) for column in row)
+            for row in engine.execute(prefix + str(compiled), params)]
+
+
+def benchmark(db):
+    """
+    Print the query plan and median latency of each grid query. Run it before
+    and after migrate to compare.
+    """
+    engine = db.get_engine(bind='gameframe')
+
+    for name, query in grid_queries(db.session).items():
+        page = query.limit(GRID_PAGE_SIZE)
+
+        # Flask-Restless counts the results of every page
+        pages, counts = [], []
+        for _ in range(BENCHMARK_RUNS):
+            t = time()
+            page.all()
+            pages.append(time() - t)
+
+            t = time()
+            query.order_by(None).count()
+            counts.append(time() - t)
+
+        print("[BENCHMARK] %s: page %.2f ms, count %.2f ms" %
+              (name, median(pages) * 1000, median(counts) * 1000))
+        for line in explain(engine, page):
+            print("    " + line)
+
+
+def migrate_join_table(db, inspector, table):
+    """
+    Key a join table on both of its columns if it has no such key. Duplicate
+    rows are removed first.
+    """
+    engine = db.get_engine(bind='gameframe')
+    columns = [column.name for column in table.primary_key.columns]
+
+    keys = [inspector.get_pk_constraint(table.name)['constrained_columns']]
+    keys += [index['column_names'] for index in inspector.get_indexes(table.name)
+             if index['unique']]
+    keys += [constraint['column_names'] for constraint in
+             inspector.get_unique_constraints(table.name)]
+    if any(set(key) == set(columns) for key in keys):
+        return
+
+    total = db.session.execute(select([db.func.count()]).select_from(table)).scalar()
+    rows = {tuple(row) for row in
+            db.session.execute(select([table.c[name] for name in columns]))}
+
+    db.session.execute(table.delete())
+    insert_edges(db.session, table, [dict(zip(columns, row)) for row in rows])
+    db.session.execute('CREATE UNIQUE INDEX ux_%s ON %s (%s)' %
+                       (table.name, table.name, ', '.join(columns)), bind=engine)
+    db.session.commit()
+
+    print("[MIGRATE] Keyed %s and removed %d duplicate rows" %
+          (table.name, total - len(rows)))
+
+
+def migrate(db):
+    """
+    Create the missing tables and indexes of the schema and key the join
+    tables. Existing tables and indexes are left alone, so it can run on any
+    database.
+    """
+    engine = db.get_engine(bind='gameframe')
+    db.create_all(bind='gameframe')
+
+    inspector = inspect(engine)
+    for table in db.get_tables_for_bind('gameframe'):
+        if table.name.startswith('join_'):
+            migrate_join_table(db, inspector, table)
+
+        existing = inspector.get_indexes(table.name)
+        names = {index['name'] for index in existing}
+        columns = {tuple(index['column_names']) for index in existing}
+
+        for index in table.indexes:
+            if index.name not in names and \
+                    tuple(c.name for c in index.columns) not in columns:
+                print("[MIGRATE] Creating index %s" % index.name)
+                index.create(engine)
+
+
 def reset(db):
     """
     Truncate all tables and reset the database
@@ -53,7 +192,7 @@ def reset(db):
     db.drop_all(bind='gameframe')
 
     # Create database schema
-    db.create_all(bind='gameframe')
+    migrate(db)
 
     # Insert static genres
     for i, n in {1: 'Action', 2: 'Point-and-click', 4: 'Fighting', 5: 'Shooter',
@@ -3,17 +3,24 @@
 # Copyright (C) 2018 GameFrame   -
 # --------------------------------
 
-from bisect import insort
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from heapq import heappop, heappush
 from math import isclose
+from types import SimpleNamespace
+import os
+import time
 
+import numpy as np
 import requests
+from sqlalchemy import bindparam, select
+from sqlalchemy.orm.attributes import set_committed_value
 
-if __name__ != "__main__":
-    from tqdm import tqdm
+from stats import Distribution
 
+if __name__ != "__main__":
     from cache import WS, load_working_set
-    from common import PROGRESS_FORMAT
+    from orm import db, bump_version, get_version, Game, PlayerCount
 
 
 """
@@ -47,111 +54,188 @@ Reference values for continuous scores
 """
 REFERENCES = {'players': 50000}
 
+"""
+The link counts of every game, used to set the link count references
+"""
+STATS = {'article': Distribution(), 'video': Distribution(),
+         'tweet': Distribution()}
 
-def compute(game):
+"""
+Link count references are set to REFERENCE_SCALE times the REFERENCE_PERCENTILE
+percentile of the link counts
+"""
+REFERENCE_PERCENTILE = float(os.environ.get('REFERENCE_PERCENTILE', 100))
+REFERENCE_SCALE = float(os.environ.get('REFERENCE_SCALE', 0.85))
+
+"""
+The bounds on the time between two player count requests for a game, in seconds
+"""
+MIN_POLL_INTERVAL = 5 * 60
+MAX_POLL_INTERVAL = 7 * 24 * 60 * 60
+
+"""
+The number of players that one VINDEX point is worth when scheduling polls
+"""
+PLAYERS_PER_VINDEX = 10
+
+"""
+The number of concurrent player count requests
+"""
+POLL_WORKERS = int(os.environ.get('POLL_WORKERS', 8))
+
+"""
+The number of games written per UPDATE while polling
+"""
+POLL_BATCH = 500
+
+"""
+The largest number of seconds that polled games wait to be written when a batch
+does not fill up
+"""
+POLL_FLUSH_INTERVAL = 5 * 60
+
+"""
+The number of seconds between removals of expired player counts
+"""
+PRUNE_INTERVAL = 60 * 60
+
+"""
+Game columns that count towards the VINDEX when they are present
+"""
+FLAG_COLUMNS = ['esrb', 'website', 'steam_id', 'igdb_id']
+
+"""
+Game columns that count towards the VINDEX by value. Missing values count as 0.
+"""
+VALUE_COLUMNS = ['metacritic', 'steam_players', 'article_count', 'video_count',
+                 'tweet_count']
+
+
+def load_columns(games):
     """
-    Compute the VINDEX of the given game.
+    Load the inputs of the given games or rows into NumPy arrays
+    """
+    columns = {column: np.array([getattr(game, column) is not None
+                                 for game in games], dtype=bool)
+               for column in FLAG_COLUMNS}
+    columns.update({column: np.array([getattr(game, column) or 0
+                                      for game in games], dtype=float)
+                    for column in VALUE_COLUMNS})
+    return columns
+
+
+def scores(columns):
+    """
+    Compute the VINDEX of every game in the given columns in one pass.
 
     Precondition: precompute must be called before this function.
     """
 
     # ESRB score
-    esrb = 0
-    if game.esrb is not None:
-        esrb = 100
+    esrb = np.where(columns['esrb'], 100, 0)
 
     # Article score
-    article_score = (len(game.articles) / REFERENCES['article']) * 100
+    article_score = (columns['article_count'] / REFERENCES['article']) * 100
 
     # Video score
-    video_score = (len(game.videos) / REFERENCES['video']) * 100
+    video_score = (columns['video_count'] / REFERENCES['video']) * 100
 
     # Tweet score
-    tweet_score = (len(game.tweets) / REFERENCES['tweet']) * 100
+    tweet_score = (columns['tweet_count'] / REFERENCES['tweet']) * 100
 
     # Steam players
-    player_score = 0
-    if game.steam_players is not None:
-        player_score = (game.steam_players / REFERENCES['players']) * 100
+    player_score = (columns['steam_players'] / REFERENCES['players']) * 100
 
     # Website score
     # TODO website stats
-    website_score = 0
-    if game.website is not None:
-        website_score = 100
+    website_score = np.where(columns['website'], 100, 0)
 
     # Steam-IGDB score
-    steam_igdb = 0
-    if game.steam_id is not None and game.igdb_id is not None:
-        steam_igdb = 100
-    else:
-        steam_igdb = 50
+    steam_igdb = np.where(columns['steam_id'] & columns['igdb_id'], 100, 50)
 
     # Metacritic score
-    metacritic_score = 0
-    if game.metacritic is not None:
-        metacritic_score = game.metacritic
+    metacritic_score = columns['metacritic']
 
     # Convex combination
-    game.vindex = min(int(round(WEIGHTS['esrb'] * esrb +
-                                WEIGHTS['website'] * website_score +
-                                WEIGHTS['metacritic'] * metacritic_score +
-                                WEIGHTS['steam_igdb'] * steam_igdb +
-                                WEIGHTS['players'] * player_score +
-                                WEIGHTS['articles'] * article_score +
-                                WEIGHTS['videos'] * video_score +
-                                WEIGHTS['tweets'] * tweet_score)), 100)
+    return np.minimum(np.rint(WEIGHTS['esrb'] * esrb +
+                              WEIGHTS['website'] * website_score +
+                              WEIGHTS['metacritic'] * metacritic_score +
+                              WEIGHTS['steam_igdb'] * steam_igdb +
+                              WEIGHTS['players'] * player_score +
+                              WEIGHTS['articles'] * article_score +
+                              WEIGHTS['videos'] * video_score +
+                              WEIGHTS['tweets'] * tweet_score), 100).astype(int)
+
+
+def compute(game):
+    """
+    Compute the VINDEX of the given game.
+
+    Precondition: precompute must be called before this function.
+    """
+    game.vindex = int(scores(load_columns([game]))[0])
+
+
+def compute_batch(session, table):
+    """
+    Compute the VINDEX of every game in the given table and write them with
+    one bulk UPDATE. Returns a dictionary of game ids to VINDEX values.
+    """
+    rows = session.execute(select([table.c[column] for column in
+                                   ['game_id'] + FLAG_COLUMNS + VALUE_COLUMNS])).fetchall()
+    if len(rows) == 0:
+        return {}
+
+    precompute(rows)
+    vindices = dict(zip((row.game_id for row in rows),
+                        scores(load_columns(rows)).tolist()))
+
+    session.execute(table.update()
+                    .where(table.c.game_id == bindparam('b_game_id'))
+                    .values(vindex=bindparam('b_vindex')),
+                    [{'b_game_id': game_id, 'b_vindex': vindex}
+                     for game_id, vindex in vindices.items()])
+    return vindices
 
 
 def precompute(games):
     """
     Compute reference information about the dataset
     """
-    if ('article' not in REFERENCES or 'video' not in REFERENCES
-            or 'tweet' not in REFERENCES):
+    print('[VINDEX] Computing link statistics and reference values')
 
-        articles = []
-        videos = []
-        tweets = []
+    for dist in STATS.values():
+        dist.__init__()
+    for game in games:
+        observe(game, refresh=False)
 
-        print('[VINDEX] Computing link statistics and reference values')
+    print("(MAX) Article: %d Video: %d Tweet: %d\n(MED) Article: %d Video: %d Tweet: %d\n(AVE) Article: %d Video: %d Tweet: %d\n" %
+          tuple(getattr(STATS[link], stat)()
+                for stat in ['max', 'median', 'mean']
+                for link in ['article', 'video', 'tweet']))
 
-        # Collect sorted link information
-        for game in games:
-            insort(articles, game.article_count
-                   if game.article_count is not None else 0)
-            insort(videos, game.video_count
-                   if game.video_count is not None else 0)
-            insort(tweets, game.tweet_count
-                   if game.tweet_count is not None else 0)
+    refresh_references()
 
-        article_len = len(articles)
-        video_len = len(videos)
-        tweet_len = len(tweets)
 
-        # Compute maximums
-        article_max = articles[-1]
-        video_max = videos[-1]
-        tweet_max = tweets[-1]
-
-        # Compute medians
-        article_med = articles[article_len // 2]
-        video_med = videos[video_len // 2]
-        tweet_med = tweets[tweet_len // 2]
+def observe(game, refresh=True):
+    """
+    Record the link counts of a game in the dataset statistics
+    """
+    for link, dist in STATS.items():
+        count = getattr(game, link + '_count')
+        dist.update(game.game_id, count if count is not None else 0)
 
-        # Compute averages
-        article_ave = sum(articles) / article_len
-        video_ave = sum(videos) / video_len
-        tweet_ave = sum(tweets) / tweet_len
+    if refresh:
+        refresh_references()
 
-        print("(MAX) Article: %d Video: %d Tweet: %d\n(MED) Article: %d Video: %d Tweet: %d\n(AVE) Article: %d Video: %d Tweet: %d\n" %
-              (article_max, video_max, tweet_max, article_med,
-               video_med, tweet_med, article_ave, video_ave, tweet_ave))
 
-        # Set the references to 85% of the maximum
-        REFERENCES['article'] = max(int(round(0.85 * article_max)), 1)
-        REFERENCES['video'] = max(int(round(0.85 * video_max)), 1)
-        REFERENCES['tweet'] = max(int(round(0.85 * tweet_max)), 1)
+def refresh_references():
+    """
+    Set the link count references from the dataset statistics
+    """
+    for link, dist in STATS.items():
+        REFERENCES[link] = max(int(round(
+            REFERENCE_SCALE * dist.percentile(REFERENCE_PERCENTILE))), 1)
 
 
 def compute_all():
@@ -159,11 +243,18 @@ def compute_all():
     Compute the VINDEX for all games in the working set
     """
     load_working_set()
-    precompute(WS.games.values())
 
-    for game in tqdm(WS.games.values(), '[VINDEX] Computing game vindicies',
-                     bar_format=PROGRESS_FORMAT):
-        compute(game)
+    # Write the current link counts first
+    WS.flush()
+
+    print('[VINDEX] Computing game vindicies')
+    vindices = compute_batch(db.session, Game.__table__)
+    bump_version()
+    db.session.commit()
+
+    # Keep the working set in sync without marking it as changed
+    for game in WS.games.values():
+        set_committed_value(game, 'vindex', vindices[game.game_id])
 
 
 def benckmark():
@@ -180,12 +271,274 @@ def benckmark():
         print("Computed VINDEX: %d for game: %s" % (game.vindex, game.name))
 
 
-def rq_player_count(appid):
+class Rollup ():
+    """
+    A Rollup accumulates player count samples into hourly and daily buckets.
+    A bucket is complete once a later sample of the same game falls outside
+    of it.
+    """
+
+    def __init__(self):
+        # (game_id, resolution) => [start, total, samples, peak]
+        self.buckets = {}
+
+    def add(self, game_id, timestamp, players):
+        """
+        Add a sample and return the points of the buckets that it completed
+        """
+        completed = []
+        for resolution in PlayerCount.ROLLUPS:
+            start = bucket(timestamp, resolution)
+            current = self.buckets.get((game_id, resolution))
+
+            if current is None or current[0] != start:
+                if current is not None:
+                    completed.append(point(game_id, resolution, current[0],
+                                           int(round(current[1] / current[2])),
+                                           current[3]))
+                current = self.buckets[game_id, resolution] = [start, 0, 0, 0]
+
+            current[1] += players
+            current[2] += 1
+            current[3] = max(current[3], players)
+
+        return completed
+
+    def discard(self, game_id):
+        """
+        Drop the open buckets of a game
+        """
+        for resolution in PlayerCount.ROLLUPS:
+            self.buckets.pop((game_id, resolution), None)
+
+
+def bucket(timestamp, resolution):
+    """
+    Return the start of the hourly or daily bucket that contains a timestamp
+    """
+    if resolution == PlayerCount.DAILY:
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def point(game_id, resolution, timestamp, players, peak):
+    """
+    Produce a PlayerCount row
+    """
+    return {'game_id': game_id, 'resolution': resolution,
+            'timestamp': timestamp, 'players': players, 'peak': peak}
+
+
+def poll_interval(players, vindex):
+    """
+    Return the number of seconds to wait before polling a game again. Games
+    with more players or a higher VINDEX are polled more often.
+    """
+    activity = (players or 0) + PLAYERS_PER_VINDEX * (vindex or 0)
+    return min(max(MAX_POLL_INTERVAL / (1 + activity), MIN_POLL_INTERVAL),
+               MAX_POLL_INTERVAL)
+
+
+def load_records(table, records):
+    """
+    Load the games with a Steam AppID into records as plain objects. Records
+    that already exist keep their polled player counts and only take the new
+    values of the other inputs. Records of games that no longer exist are
+    dropped. Returns the IDs of the added and of the dropped games.
+    """
+    columns = ['game_id', 'vindex', 'steam_players_updated'] + \
+        FLAG_COLUMNS + VALUE_COLUMNS
+    added = []
+    found = set()
+    for row in db.session.execute(select([table.c[column] for column in columns])
+                                  .where(table.c.steam_id != None)):
+        found.add(row.game_id)
+        record = records.get(row.game_id)
+        if record is None:
+            records[row.game_id] = SimpleNamespace(**dict(row))
+            added.append(row.game_id)
+            continue
+
+        for column in FLAG_COLUMNS + VALUE_COLUMNS:
+            if column != 'steam_players':
+                setattr(record, column, row[column])
+
+    dropped = [game_id for game_id in records if game_id not in found]
+    for game_id in dropped:
+        del records[game_id]
+
+    return added, dropped
+
+
+def poll():
+    """
+    Continuously update Steam player counts and VINDEX values. Games are
+    scheduled by their last observed player count and VINDEX, requested
+    concurrently, and written back in batches of POLL_BATCH games, or sooner
+    once a batch has waited POLL_FLUSH_INTERVAL. The games and their link
+    counts are reloaded whenever another process changes the dataset, and
+    games that were removed are no longer polled.
+    """
+    table = Game.__table__
+
+    # Work on plain records instead of ORM objects
+    records = {}
+    load_records(table, records)
+    if len(records) == 0:
+        return
+
+    precompute(records.values())
+    version = get_version()
+
+    # Each record remembers its latest entry, so older entries of rescheduled
+    # or dropped games are skipped
+    schedule = []
+
+    def plan(record, due):
+        record.due = due
+        heappush(schedule, (due, record.game_id))
+
+    # Schedule every game relative to its last update
+    now = time.time()
+    for record in records.values():
+        due = now
+        if record.steam_players_updated is not None:
+            due = record.steam_players_updated.timestamp() + \
+                poll_interval(record.steam_players, record.vindex)
+        plan(record, due)
+
+    # Resume the rollups of the current day from the stored samples
+    rollup = Rollup()
+    points_table = PlayerCount.__table__
+    for row in db.session.execute(
+            select([points_table.c.game_id, points_table.c.timestamp,
+                    points_table.c.players])
+            .where(points_table.c.resolution == PlayerCount.RAW)
+            .where(points_table.c.timestamp >=
+                   bucket(datetime.now(), PlayerCount.DAILY))
+            .order_by(points_table.c.timestamp)):
+        if row.game_id in records:
+            rollup.add(row.game_id, row.timestamp, row.players)
+
+    # Reuse connections across requests
+    session = requests.Session()
+    session.mount('https://',
+                  requests.adapters.HTTPAdapter(pool_maxsize=POLL_WORKERS))
+
+    def request(record):
+        try:
+            return rq_player_count(record.steam_id, session)
+        except (requests.exceptions.RequestException, KeyError, ValueError):
+            return None
+
+    print('[VINDEX] Polling %d games' % len(records))
+    pending = []
+    points = []
+    changed = False
+    flushed = time.time()
+    pruned = 0
+    with ThreadPoolExecutor(POLL_WORKERS) as executor:
+        while True:
+            # Pick up link counts and games written by other processes
+            if get_version() != version:
+                now = time.time()
+                added, dropped = load_records(table, records)
+                for game_id in added:
+                    plan(records[game_id], now)
+
+                # Forget the samples of removed games
+                dropped = set(dropped)
+                for game_id in dropped:
+                    rollup.discard(game_id)
+                pending = [r for r in pending if r.game_id not in dropped]
+                points = [p for p in points if p['game_id'] not in dropped]
+
+                precompute(records.values())
+                version = get_version()
+
+            now = time.time()
+
+            # Write full batches, or partial ones that waited long enough
+            if len(pending) == POLL_BATCH or \
+                    (len(pending) > 0 and now - flushed >= POLL_FLUSH_INTERVAL):
+                written = write_records(table, pending, points, bump=changed)
+                if written == (version or 0) + 1:
+                    version = written
+                pending = []
+                points = []
+                changed = False
+            if len(pending) == 0:
+                flushed = now
+
+            # Take no more games than fit in the pending batch
+            due = []
+            while len(schedule) > 0 and schedule[0][0] <= now and \
+                    len(pending) + len(due) < POLL_BATCH:
+                when, game_id = heappop(schedule)
+                record = records.get(game_id)
+                if record is not None and record.due == when:
+                    due.append(record)
+
+            if len(due) == 0:
+                if now - pruned >= PRUNE_INTERVAL:
+                    prune_points()
+                    pruned = now
+
+                wake = now + MIN_POLL_INTERVAL
+                if len(schedule) > 0:
+                    wake = min(wake, schedule[0][0])
+                if len(pending) > 0:
+                    wake = min(wake, flushed + POLL_FLUSH_INTERVAL)
+                time.sleep(max(wake - now, 0))
+                continue
+
+            for record, players in zip(due, executor.map(request, due)):
+                if players is not None:
+                    record.steam_players = players
+                    record.steam_players_updated = datetime.now()
+
+                    # Record the sample and any rollups that it completed
+                    points.append(point(record.game_id, PlayerCount.RAW,
+                                        record.steam_players_updated,
+                                        players, players))
+                    points.extend(rollup.add(record.game_id,
+                                             record.steam_players_updated,
+                                             players))
+
+                # Refresh the references and recompute VINDEX
+                previous = record.vindex
+                observe(record)
+                compute(record)
+
+                # New player counts change the API responses as well
+                changed = changed or players is not None or \
+                    record.vindex != previous
+
+                interval = poll_interval(record.steam_players, record.vindex)
+                plan(record, time.time() + interval)
+                pending.append(record)
+
+
+def prune_points():
+    """
+    Remove player counts that are older than their retention period
+    """
+    table = PlayerCount.__table__
+    for resolution, retention in PlayerCount.RETENTION.items():
+        db.session.execute(table.delete()
+                           .where(table.c.resolution == resolution)
+                           .where(table.c.timestamp <
+                                  datetime.fromtimestamp(time.time() - retention)))
+    db.session.commit()
+
+
+def rq_player_count(appid, session=requests):
     """
     Request the current number of Steam players for the given game
     """
-    rq = requests.get("https://api.steampowered.com/ISteamUserStats/" +
-                      "GetNumberOfCurrentPlayers/v1", {'appid': appid})
+    rq = session.get("https://api.steampowered.com/ISteamUserStats/" +
+                     "GetNumberOfCurrentPlayers/v1", params={'appid': appid})
 
     if not rq.status_code == requests.codes.ok:
         return None
@@ -198,20 +551,63 @@ def rq_player_count(appid):
     return None
 
 
+def write_records(table, records, points, bump=True):
+    """
+    Write the player counts and VINDEX values of the given records with one
+    bulk UPDATE, and store the given PlayerCount points. The dataset version is
+    only bumped if requested, so batches in which no game changed leave API
+    caches in place. Returns the new dataset version or None if it was not
+    bumped.
+    """
+    if len(records) == 0:
+        return None
+
+    db.session.execute(table.update()
+                       .where(table.c.game_id == bindparam('b_game_id'))
+                       .values(steam_players=bindparam('b_steam_players'),
+                               steam_players_updated=bindparam(
+                                   'b_steam_players_updated'),
+                               vindex=bindparam('b_vindex')),
+                       [{'b_game_id': record.game_id,
+                         'b_steam_players': record.steam_players,
+                         'b_steam_players_updated': record.steam_players_updated,
+                         'b_vindex': record.vindex} for record in records])
+
+    # Keep only the points of games that still exist, since games can be
+    # removed before the poller sees the new dataset version
+    if len(points) > 0:
+        existing = {row.game_id for row in db.session.execute(
+            select([table.c.game_id])
+            .where(table.c.game_id.in_({p['game_id'] for p in points})))}
+        points = [p for p in points if p['game_id'] in existing]
+
+    # Replace points that were already stored
+    if len(points) > 0:
+        points_table = PlayerCount.__table__
+        db.session.execute(points_table.delete()
+                           .where(points_table.c.game_id == bindparam('b_game_id'))
+                           .where(points_table.c.resolution == bindparam('b_resolution'))
+                           .where(points_table.c.timestamp == bindparam('b_timestamp')),
+                           [{'b_game_id': p['game_id'], 'b_resolution': p['resolution'],
+                             'b_timestamp': p['timestamp']} for p in points])
+        db.session.execute(points_table.insert(), points)
+
+    version = bump_version() if bump else None
+    db.session.commit()
+    return version
+
+
 if __name__ == "__main__":
     """
     A background thread that continuously updates steam players and vindex.
     """
 
-    import os
     import sys
-    import time
-    import random
     sys.path.append(os.path.abspath('/app'))
 
     from flask import Flask
 
-    from app.orm import db, Game
+    from app.orm import db, bump_version, get_version, Game, PlayerCount
 
     # Initialize Flask
     app = Flask(__name__)
@@ -225,30 +621,4 @@ if __name__ == "__main__":
     db.init_app(app)
 
     with app.app_context():
-        games = Game.query.filter(Game.steam_id != None).all()
-        precompute(games)
-
-        # The minimum amount of time that a single computation can take
-        TIMESLOT = int(round((60 * 60 * 24) / len(games)))
-
-        print('[VINDEX] Starting incremental update')
-        while True:
-            for game in games:
-                t = time.time()
-
-                # Update steam players
-                steam_players = rq_player_count(game.steam_id)
-                if steam_players is not None:
-                    game.steam_players = steam_players
-
-                    # Update timestamp
-                    game.steam_players_updated = datetime.now()
-
-                # Recompute VINDEX
-                compute(game)
-
-                # Random commit to reduce load
-                if random.randrange(100) < 10:
-                    db.session.commit()
-
-                time.sleep(max(TIMESLOT - int(time.time() - t), 0))
+        poll()
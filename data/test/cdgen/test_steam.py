@@ -4,10 +4,11 @@
 # --------------------------------
 
 from unittest import main, TestCase
+import numpy as np
 from wand.image import Image
 from wand.color import Color
 
-from main.cdgen.steam import color_average
+from main.cdgen.steam import border_colors, color_average
 
 
 class TestSteam (TestCase):
@@ -21,7 +22,22 @@ class TestSteam (TestCase):
         with Image(width=100, height=100, background=Color('rgb(12, 56, 23)')) as test:
             self.assertEqual((12, 56, 23), color_average(test))
 
-        # TODO Test the 25% shortcut and top 50% averaging
+    def test_border_colors(self):
+        # Test the most frequent color shortcut
+        row = np.array([[10, 10, 10]] * 5 + [[0, 0, 0]] * 4 + [[50, 50, 50]] * 3 +
+                       [[200, 0, 0]] * 2 + [[0, 200, 0]] * 2, dtype=np.uint8)
+        self.assertEqual([(10, 10, 10)], border_colors(row[None]))
+
+        # Test averaging the top quartile
+        row = np.array([[40, 0, 0]] * 3 + [[0, 40, 0]] * 2 + [[0, 0, 40]] +
+                       [[255, 255, 255]] * 6, dtype=np.uint8)
+        row[6:] = np.arange(6)[:, None] + 100
+        self.assertEqual([(24, 16, 0)], border_colors(row[None]))
+
+        # Test a batch of rows
+        rows = np.zeros((2, 8, 3), dtype=np.uint8)
+        rows[1] = 7
+        self.assertEqual([(0, 0, 0), (7, 7, 7)], border_colors(rows))
 
 
 if __name__ == '__main__':
@@ -9,7 +9,8 @@ from orm import Game, Developer, Video, Article
 from unittest import main, TestCase
 from sources.util import (parse_steam_date, condition, condition_heavy,
                           condition_developer, keywordize, xappend,
-                          url_normalize, dict_delete)
+                          url_normalize, dict_delete, KeywordAutomaton,
+                          plan_strides, concurrent_collect)
 
 
 class TestUtil (TestCase):
@@ -100,6 +101,43 @@ class TestUtil (TestCase):
         self.assertEqual(len1, len(dev.articles))
         self.assertEqual(len2, len(article.developers))
 
+    def test_concurrent_collect(self):
+
+        class Cache():
+            def __init__(self):
+                self.queue = None
+                self.rows = []
+
+            def add(self, row):
+                if self.queue is not None:
+                    self.queue.put(row)
+                else:
+                    self.store(row)
+
+            def store(self, row):
+                self.rows.append(row)
+
+        cache = Cache()
+
+        def rq_func(d):
+            cache.add(d)
+            cache.add(-d)
+
+        concurrent_collect(rq_func, cache, '', list(range(1, 501)), 8)
+        self.assertIsNone(cache.queue)
+        self.assertEqual(sorted(list(range(-500, 0)) + list(range(1, 501))),
+                         sorted(cache.rows))
+
+        # Worker errors reach the caller
+        def rq_fail(d):
+            if d == 7:
+                raise ValueError()
+            cache.add(d)
+
+        with self.assertRaises(ValueError):
+            concurrent_collect(rq_fail, cache, '', list(range(20)), 4)
+        self.assertIsNone(cache.queue)
+
     def test_dict_delete(self):
 
         a = {'A': 'x', 'B': 'y', 'C': 'z'}
@@ -110,6 +148,40 @@ class TestUtil (TestCase):
         dict_delete(b, 'U')
         self.assertEqual(b, {'M': 'p', 'N': 'q'})
 
+    def test_keyword_automaton(self):
+
+        automaton = KeywordAutomaton(["he", "she", "his", "hers", "she"])
+        self.assertEqual(["he", "she", "hers"], automaton.search("ushers"))
+        self.assertEqual(["his"], automaton.search("this"))
+        self.assertEqual([], automaton.search("nothing"))
+
+        # Overlapping and nested keywords
+        automaton = KeywordAutomaton(["portal2", "portal", "al2", "tal"])
+        self.assertEqual(["portal2", "portal", "al2", "tal"],
+                         automaton.search("playportal2now"))
+        self.assertEqual(["portal", "tal"], automaton.search("portal"))
+
+        # Agrees with the naive substring search
+        names = ["doom", "doom3", "om", "farcry", "farcry5", "cry", "y5", "x"]
+        automaton = KeywordAutomaton(names)
+        for text in ["doom3andfarcry5", "farfarcr", "", "xdoomy5", "mmoodd"]:
+            self.assertEqual([n for n in names if n in text],
+                             automaton.search(text))
+
+        # The empty keyword matches everything
+        automaton = KeywordAutomaton(["", "a"])
+        self.assertEqual([""], automaton.search("bcd"))
+        self.assertEqual(["", "a"], automaton.search("ba"))
+
+    def test_plan_strides(self):
+
+        self.assertEqual([], plan_strides([], 100))
+        self.assertEqual([5], plan_strides(range(5, 105), 100))
+        self.assertEqual([5, 105], plan_strides(range(5, 106), 100))
+        self.assertEqual([1, 150, 250, 400], plan_strides(
+            [400, 150, 1, 99, 100, 249, 250, 401], 100))
+        self.assertEqual([3, 7], plan_strides({3, 4, 7, 8}, 4))
+
     def test_url_normalize(self):
 
         self.assertEqual("http://gameframe.online", url_normalize(
@@ -0,0 +1,72 @@
+# --------------------------------
+# Unit tests for the API scraper -
+# Copyright (C) 2018 GameFrame   -
+# --------------------------------
+
+import os
+import tempfile
+from threading import Lock
+from unittest import main, TestCase
+
+from aws import file_md5, upload_images
+
+
+class StubPaginator ():
+    """
+    Serves a fixed object listing in pages of one object
+    """
+
+    def __init__(self, objects):
+        self.objects = objects
+
+    def paginate(self, Bucket, Prefix):
+        for key, etag in sorted(self.objects.items()):
+            if key.startswith(Prefix):
+                yield {'Contents': [{'Key': key, 'ETag': '"%s"' % etag}]}
+
+
+class StubS3 ():
+    """
+    An in-memory stand-in for the S3 client
+    """
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.uploads = []
+        self.lock = Lock()
+
+    def get_paginator(self, operation):
+        assert operation == 'list_objects_v2'
+        return StubPaginator(self.objects)
+
+    def upload_file(self, filename, bucket, key, ExtraArgs=None):
+        with self.lock:
+            self.uploads.append(key)
+            self.objects[key] = file_md5(filename)
+
+
+class TestAWS (TestCase):
+
+    def test_upload_images(self):
+        """
+        Test that only missing and changed images are uploaded
+        """
+
+        with tempfile.TemporaryDirectory() as location:
+            images = []
+            for name, content in [('1', b'same'), ('2', b'changed'), ('3', b'new')]:
+                with open(os.path.join(location, name), 'wb') as h:
+                    h.write(content)
+                images.append((os.path.join(location, name), 'cover/' + name))
+
+            client = StubS3({'cover/1': file_md5(images[0][0]),
+                             'cover/2': 'stale', 'other/3': 'ignored'})
+            uploaded = upload_images(images, 'cover/', client, workers=2)
+
+            self.assertEqual(['cover/2', 'cover/3'], uploaded)
+            self.assertEqual(['cover/2', 'cover/3'], sorted(client.uploads))
+            self.assertEqual([], upload_images(images, 'cover/', client))
+
+
+if __name__ == '__main__':
+    main()
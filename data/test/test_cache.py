@@ -0,0 +1,309 @@
+# --------------------------------
+# Unit tests for the API scraper -
+# Copyright (C) 2018 GameFrame   -
+# --------------------------------
+
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from unittest import main, TestCase
+
+from flask import Flask
+
+import cache
+from cache import EdgeSet, TableCache, WorkingSet, insert_edges
+from orm import db, Game, PlayerCount, STRUCTURE_VERSION, join_game_developer
+
+
+class CachedThing(db.Model):
+    """
+    A registry model for TableCache tests
+    """
+    __bind_key__ = 'registry'
+
+    thing_id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.Integer)
+
+
+class DatabaseTestCase (TestCase):
+    """
+    Runs each test in an app context with fresh SQLite databases
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.snapshot = cache.SNAPSHOT
+        cache.SNAPSHOT = os.path.join(self.directory, 'ws.snapshot')
+
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        app.config['SQLALCHEMY_BINDS'] = {
+            'gameframe': 'sqlite:///' + os.path.join(self.directory, 'g.db'),
+            'registry': 'sqlite:///' + os.path.join(self.directory, 'r.db')}
+        db.init_app(app)
+
+        self.context = app.app_context()
+        self.context.push()
+        db.create_all(bind=['gameframe', 'registry'])
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+        cache.SNAPSHOT = self.snapshot
+        shutil.rmtree(self.directory)
+
+
+class TestEdgeSet (TestCase):
+
+    def test_edges(self):
+        """
+        Test adding, looking up, and discarding edges
+        """
+
+        edges = EdgeSet(join_game_developer, 'game_id', 'developer_id')
+        edges.load([(1, 10)])
+
+        self.assertFalse(edges.add(1, 10))
+        self.assertTrue(edges.add(1, 11))
+        self.assertTrue(edges.add(2, 10))
+        self.assertFalse(edges.add(2, 10))
+        self.assertEqual({(1, 11), (2, 10)}, edges.pending)
+
+        self.assertEqual({10, 11}, edges.rights(1))
+        self.assertEqual({1, 2}, edges.lefts(10))
+        self.assertEqual(frozenset(), edges.rights(3))
+
+        self.assertEqual({10, 11}, edges.discard_left(1))
+        self.assertEqual({2}, edges.lefts(10))
+        self.assertEqual({(2, 10)}, edges.pending)
+
+        self.assertEqual({2}, edges.discard_right(10))
+        self.assertEqual(0, len(edges))
+        self.assertEqual(set(), edges.pending)
+
+
+class TestWorkingSet (DatabaseTestCase):
+
+    def links(self):
+        return sorted(tuple(row) for row in
+                      db.session.execute(join_game_developer.select()))
+
+    def test_insert_edges(self):
+        """
+        Test that existing and repeated edges are skipped
+        """
+
+        rows = [{'game_id': 1, 'developer_id': 2},
+                {'game_id': 1, 'developer_id': 3}]
+        self.assertEqual(2, insert_edges(db.session, join_game_developer, rows))
+        insert_edges(db.session, join_game_developer, rows + rows)
+        db.session.commit()
+
+        self.assertEqual([(1, 2), (1, 3)], self.links())
+
+    def test_link_recount(self):
+        """
+        Test that links and unlinks update the link counts
+        """
+
+        ws = WorkingSet()
+        ws.initialize(db)
+        game = ws.build_game(1, 10, None, 'Doom', 'doom')
+        dev = ws.build_developer(2, 20, 'id', 'id')
+        other = ws.build_developer(3, 30, 'Bethesda', 'bethesda')
+
+        ws.link(ws.game_developers, game, dev)
+        ws.link(ws.game_developers, game, other)
+        ws.recount(game)
+        ws.recount(dev)
+        self.assertEqual(2, game.developer_count)
+        self.assertEqual(1, dev.game_count)
+
+        ws.del_developer(other)
+        self.assertIn(game, ws.dirty)
+        ws.recount(game)
+        self.assertEqual(1, game.developer_count)
+
+        ws.unlink(game)
+        ws.recount(dev)
+        self.assertEqual(0, dev.game_count)
+
+    def test_flush(self):
+        """
+        Test that flushing writes links once and that an unchanged working set
+        is not written again
+        """
+
+        ws = WorkingSet()
+        ws.initialize(db)
+        game = ws.build_game(1, 10, None, 'Doom', 'doom')
+        dev = ws.build_developer(2, 20, 'id', 'id')
+        ws.link(ws.game_developers, game, dev)
+
+        ws.flush()
+        self.assertEqual([(1, 2)], self.links())
+        self.assertEqual(1, db.session.query(Game).get(1).developer_count)
+
+        # Links loaded from the database are not written again
+        db.session.remove()
+        ws = WorkingSet()
+        ws.initialize(db)
+        game = ws.games[1]
+        ws.link(ws.game_developers, game, ws.developers_id[2])
+        self.assertEqual(set(), ws.game_developers.pending)
+
+        version = cache.get_version()
+        ws.flush()
+        self.assertEqual(version, cache.get_version())
+        self.assertEqual([(1, 2)], self.links())
+
+    def test_remove_game(self):
+        """
+        Test that removing a game removes its player counts
+        """
+
+        ws = WorkingSet()
+        ws.initialize(db)
+        game = ws.build_game(1, 10, None, 'Doom', 'doom')
+        ws.flush()
+        db.session.add(PlayerCount(game_id=1, resolution=PlayerCount.RAW,
+                                   timestamp=datetime(2018, 4, 1), players=5))
+        db.session.commit()
+
+        ws.del_game(game)
+        ws.flush()
+        self.assertEqual(0, db.session.query(Game).count())
+        self.assertEqual(0, db.session.query(PlayerCount).count())
+
+    def test_snapshot(self):
+        """
+        Test that the snapshot follows the structure version rather than the
+        dataset version
+        """
+
+        ws = WorkingSet()
+        ws.initialize(db)
+        ws.build_game(1, 10, None, 'Doom', 'doom')
+        ws.flush()
+        db.session.remove()
+
+        # Player count updates bump only the dataset version
+        cache.bump_version()
+        db.session.commit()
+        ws = WorkingSet()
+        ws.initialize(db)
+        self.assertTrue(os.path.isfile(cache.SNAPSHOT))
+        self.assertIn(1, ws.games)
+        db.session.remove()
+
+        cache.bump_version(STRUCTURE_VERSION)
+        db.session.commit()
+        ws = WorkingSet()
+        ws.initialize(db)
+        self.assertFalse(os.path.isfile(cache.SNAPSHOT))
+        self.assertIn(1, ws.games)
+
+    def test_interrupted_flush(self):
+        """
+        Test that a flush that stops between chunks invalidates the snapshot
+        """
+
+        ws = WorkingSet()
+        ws.initialize(db)
+        ws.build_game(1, 10, None, 'Doom', 'doom')
+        ws.flush()
+
+        chunk = cache.FLUSH_CHUNK
+        cache.FLUSH_CHUNK = 1
+        try:
+            ws.build_game(2, 20, None, 'Quake', 'quake')
+            ws.build_game(3, 30, None, 'Hexen', 'hexen')
+
+            # Stop before the second chunk
+            recounts = []
+
+            def recount(model):
+                recounts.append(model)
+                if len(recounts) == 2:
+                    raise KeyboardInterrupt()
+
+            ws.recount = recount
+            with self.assertRaises(KeyboardInterrupt):
+                ws.flush()
+        finally:
+            cache.FLUSH_CHUNK = chunk
+        db.session.remove()
+
+        # The written chunk is loaded from the database
+        written = recounts[0].game_id
+        self.assertEqual(2, db.session.query(Game).count())
+        ws = WorkingSet()
+        ws.initialize(db)
+        self.assertFalse(os.path.isfile(cache.SNAPSHOT))
+        self.assertIn(written, ws.games)
+
+
+class TestTableCache (DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.rows = cache.CHECKPOINT_ROWS
+        cache.CHECKPOINT_ROWS = 2
+
+    def tearDown(self):
+        cache.CHECKPOINT_ROWS = self.rows
+        super().tearDown()
+
+    def count(self):
+        return db.session.query(CachedThing).count()
+
+    def test_checkpoint(self):
+        """
+        Test that rows are written in checkpoints of CHECKPOINT_ROWS
+        """
+
+        table = TableCache(CachedThing, 'key')
+        for i in range(5):
+            table.add(CachedThing(thing_id=i, key=i))
+
+        self.assertEqual(2, table.checkpoints)
+        self.assertEqual(4, self.count())
+        self.assertEqual(5, len(table))
+
+        table.flush()
+        self.assertEqual(3, table.checkpoints)
+        self.assertEqual(5, self.count())
+
+        # An empty buffer is not a checkpoint
+        table.checkpoint()
+        self.assertEqual(3, table.checkpoints)
+
+    def test_lazy(self):
+        """
+        Test that a lazy TableCache fetches rows on demand
+        """
+
+        db.session.add(CachedThing(thing_id=1, key=10))
+        db.session.commit()
+
+        table = TableCache(CachedThing, 'key', lazy=True)
+        self.assertTrue(table.exists(10))
+        self.assertFalse(table.exists(20))
+        self.assertIsNone(table.get(20))
+        self.assertEqual(1, table.get(10).thing_id)
+
+        # Buffered rows are written before they are fetched
+        table.add(CachedThing(thing_id=2, key=20))
+        table.lru.clear()
+        self.assertEqual(2, table.get(20).thing_id)
+        self.assertEqual(1, table.checkpoints)
+
+        table.load_rows()
+        self.assertFalse(table.lazy)
+        self.assertEqual({10, 20}, set(table.models))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+# --------------------------------
+# Unit tests for the API         -
+# Copyright (C) 2018 GameFrame   -
+# --------------------------------
+
+import json
+import os
+import shutil
+import tempfile
+from datetime import date
+from unittest import main, TestCase
+
+from flask import Flask
+
+from keyset import KeysetPager, decode_cursor, encode_cursor
+from orm import db, Game
+
+
+class TestKeyset (TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        app.config['SQLALCHEMY_BINDS'] = {
+            'gameframe': 'sqlite:///' + os.path.join(self.directory, 'g.db')}
+        db.init_app(app)
+        KeysetPager(db.session, {'game': (Game, ['summary'])}).init_app(app)
+
+        self.context = app.app_context()
+        self.context.push()
+        db.create_all(bind='gameframe')
+
+        # Ties and missing values in both sort keys
+        vindices = [30, None, 10, 30, None, 20, 10, 30]
+        for game_id, vindex in enumerate(vindices, 1):
+            db.session.add(Game(game_id=game_id, name='Game %d' % game_id,
+                                vindex=vindex, summary='Long text',
+                                release=date(2017, 1, game_id % 3 + 1)
+                                if vindex is not None else None))
+        db.session.commit()
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+        shutil.rmtree(self.directory)
+
+    def pages(self, order_by, size):
+        """
+        Follow the cursors of a sorted collection and return the game IDs of
+        every page
+        """
+        q = json.dumps({'order_by': order_by})
+        pages = []
+        cursor = ''
+        while cursor is not None:
+            response = self.client.get('/v1/grid/game', query_string={
+                'q': q, 'cursor': cursor, 'results_per_page': size})
+            self.assertEqual(200, response.status_code)
+
+            result = response.get_json()
+            pages.append([game['game_id'] for game in result['objects']])
+            cursor = result['next_cursor']
+        return pages
+
+    def test_cursor(self):
+        """
+        Test that cursors round trip sort keys of every type
+        """
+
+        for value in [None, 5, 'doom', date(2017, 3, 8)]:
+            self.assertEqual((value, 7), decode_cursor(encode_cursor(value, 7),
+                                                       Game.release
+                                                       if isinstance(value, date)
+                                                       else Game.vindex))
+
+    def test_pages(self):
+        """
+        Test that pages are ordered by the sort key and ID, with missing sort
+        keys last, and that every game appears exactly once
+        """
+
+        pages = self.pages([{'field': 'vindex', 'direction': 'desc'}], 3)
+        self.assertEqual([[8, 4, 1], [6, 7, 3], [5, 2]], pages)
+
+        pages = self.pages([{'field': 'vindex', 'direction': 'asc'}], 2)
+        self.assertEqual([[3, 7], [6, 1], [4, 8], [2, 5]], pages)
+
+        for order_by in [[], [{'field': 'release', 'direction': 'desc'}]]:
+            for size in range(1, 10):
+                ids = sum(self.pages(order_by, size), [])
+                self.assertEqual(sorted(ids), list(range(1, 9)))
+
+    def test_objects(self):
+        """
+        Test that excluded columns are left out and counts are optional
+        """
+
+        result = self.client.get('/v1/grid/game?cursor=').get_json()
+        self.assertNotIn('summary', result['objects'][0])
+        self.assertNotIn('num_results', result)
+
+        result = self.client.get('/v1/grid/game?cursor=&count=1').get_json()
+        self.assertEqual(8, result['num_results'])
+
+    def test_bad_request(self):
+        """
+        Test that malformed cursors and sorts are rejected
+        """
+
+        for query in ['cursor=bad', 'cursor=' + encode_cursor(1, 1)[:-2],
+                      'cursor=&q={"order_by":[{"field":"missing"}]}',
+                      'cursor=&q={"order_by":[{"field":"developers__name"}]}']:
+            self.assertEqual(400, self.client.get('/v1/grid/game?' + query)
+                             .status_code)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+# --------------------------------
+# Unit tests for the API         -
+# Copyright (C) 2018 GameFrame   -
+# --------------------------------
+
+import os
+import random
+import shutil
+import tempfile
+from bisect import bisect_left, insort
+from unittest import main, TestCase
+
+from flask import Flask
+
+from orm import db, Game
+from rank import RankIndex, Treap
+
+
+class TestTreap (TestCase):
+
+    def test_order_statistics(self):
+        """
+        Test ranks and smallest keys against a sorted list after random
+        inserts and removes
+        """
+
+        rng = random.Random(7)
+        treap = Treap()
+        ordered = []
+        for _ in range(2000):
+            key = rng.randrange(500)
+            position = bisect_left(ordered, key)
+            if position < len(ordered) and ordered[position] == key:
+                treap.remove(key)
+                del ordered[position]
+            else:
+                treap.insert(key)
+                insort(ordered, key)
+
+        self.assertEqual(len(ordered), len(treap))
+        for key in range(-1, 501, 7):
+            self.assertEqual(bisect_left(ordered, key), treap.rank(key))
+        for n in [0, 1, 10, len(ordered), len(ordered) + 5]:
+            self.assertEqual(ordered[:n], treap.first(n))
+
+        # Removing a missing key changes nothing
+        treap.remove(1000)
+        self.assertEqual(ordered, treap.first(len(ordered)))
+
+
+class TestRankIndex (TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        app.config['SQLALCHEMY_BINDS'] = {
+            'gameframe': 'sqlite:///' + os.path.join(self.directory, 'g.db')}
+        db.init_app(app)
+
+        self.context = app.app_context()
+        self.context.push()
+        db.create_all(bind='gameframe')
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+        shutil.rmtree(self.directory)
+
+    def set_vindex(self, vindices):
+        table = Game.__table__
+        for game_id, vindex in vindices.items():
+            db.session.execute(table.update().where(table.c.game_id == game_id)
+                               .values(vindex=vindex))
+        db.session.commit()
+
+    def test_load(self):
+        """
+        Test that loads apply new, changed, and removed VINDEX values
+        """
+
+        for game_id, vindex in enumerate([50, 80, 50, None, 20], 1):
+            db.session.add(Game(game_id=game_id, name=str(game_id), vindex=vindex))
+        db.session.commit()
+
+        ranks = RankIndex()
+        ranks.load()
+        self.assertEqual([(2, 80), (1, 50), (3, 50), (5, 20)], ranks.top(10))
+        self.assertEqual(3, ranks.rank(3))
+        self.assertIsNone(ranks.rank(4))
+
+        # Game 1 rises, game 2 loses its VINDEX, and game 4 gains one
+        self.set_vindex({1: 90, 2: None, 4: 30})
+        db.session.execute(Game.__table__.delete().where(Game.__table__.c.game_id == 5))
+        db.session.commit()
+        ranks.load()
+
+        self.assertEqual([(1, 90), (3, 50), (4, 30)], ranks.top(10))
+        self.assertEqual(3, len(ranks))
+        self.assertEqual(1, ranks.rank(1))
+        self.assertEqual(3, ranks.rank(4))
+        self.assertIsNone(ranks.rank(2))
+        self.assertIsNone(ranks.rank(5))
+        self.assertEqual([(1, 90)], ranks.top(1))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+# --------------------------------
+# Unit tests for the API         -
+# Copyright (C) 2018 GameFrame   -
+# --------------------------------
+
+import os
+import shutil
+import tempfile
+from unittest import main, TestCase
+
+from flask import Flask
+
+from orm import db, Developer, Game, join_game_developer
+from search import Group, SearchIndex, trigrams
+
+
+class TestGroup (TestCase):
+
+    def setUp(self):
+        self.group = Group([(text, {'name': text}) for text in
+                            ['doom', 'doom ii', 'quake', 'ultimate doom', 'hexen']])
+
+    def test_trigrams(self):
+        """
+        Test splitting texts into trigrams
+        """
+
+        self.assertEqual({'doo', 'oom'}, trigrams('doom'))
+        self.assertEqual(set(), trigrams('do'))
+
+    def test_search(self):
+        """
+        Test that queries of three or more characters match substrings in
+        document order
+        """
+
+        self.assertEqual([0, 1, 3], self.group.search('doom'))
+        self.assertEqual([3], self.group.search('te doo'))
+        self.assertEqual([1], self.group.search('m ii'))
+        self.assertEqual([], self.group.search('doomed'))
+        self.assertEqual([], self.group.search('xyz'))
+
+    def test_short_search(self):
+        """
+        Test that queries of fewer than three characters scan every document
+        """
+
+        self.assertEqual([0, 1, 3], self.group.search('do'))
+        self.assertEqual([2, 3, 4], self.group.search('e'))
+        self.assertEqual([0, 1, 2, 3, 4], self.group.search(''))
+
+
+class TestSearchIndex (TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        app.config['SQLALCHEMY_BINDS'] = {
+            'gameframe': 'sqlite:///' + os.path.join(self.directory, 'g.db')}
+        db.init_app(app)
+
+        self.context = app.app_context()
+        self.context.push()
+        db.create_all(bind='gameframe')
+
+        for game_id, name, vindex in [(1, 'Doom', 40), (2, 'Doom II', 90),
+                                      (3, 'Quake', 70), (4, 'Final Doom', None)]:
+            db.session.add(Game(game_id=game_id, name=name, vindex=vindex))
+        db.session.add(Developer(developer_id=1, name='id Software'))
+        db.session.add(Developer(developer_id=2, name='Raven Software'))
+        db.session.execute(join_game_developer.insert(), [
+            {'game_id': 1, 'developer_id': 1}, {'game_id': 3, 'developer_id': 2}])
+        db.session.commit()
+
+        self.index = SearchIndex()
+        self.index.load()
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+        shutil.rmtree(self.directory)
+
+    def names(self, group, query, limit=10):
+        return [hit['name'] for hit in
+                self.index.search(query, limit)[group]['objects']]
+
+    def test_vindex_order(self):
+        """
+        Test that hits are ranked by VINDEX and then by name, and that other
+        groups rank by the VINDEX of their best linked game
+        """
+
+        self.assertEqual(['Doom II', 'Doom', 'Final Doom'],
+                         self.names('game', 'DOOM'))
+        self.assertEqual(['Raven Software', 'id Software'],
+                         self.names('developer', ' software '))
+        self.assertEqual(['Doom II', 'Quake', 'Doom', 'Final Doom'],
+                         self.names('game', ''))
+
+    def test_limit(self):
+        """
+        Test that the limit caps the hits but not their count
+        """
+
+        results = self.index.search('o', 1)
+        self.assertEqual(3, results['game']['num_results'])
+        self.assertEqual(['Doom II'], self.names('game', 'o', 1))
+        self.assertEqual([], self.names('game', 'o', 0))
+
+
+if __name__ == '__main__':
+    main()
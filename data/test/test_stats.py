@@ -0,0 +1,54 @@
+# --------------------------------
+# Unit tests for the API scraper -
+# Copyright (C) 2018 GameFrame   -
+# --------------------------------
+
+from unittest import main, TestCase
+from stats import Distribution
+
+
+class TestStats (TestCase):
+
+    def test_distribution(self):
+        """
+        Test order statistics against a sorted list
+        """
+
+        dist = Distribution()
+        self.assertEqual(0, dist.max())
+        self.assertEqual(0, dist.median())
+        self.assertEqual(0, dist.mean())
+
+        values = [5, 1, 9, 1, 3, 7, 3, 3]
+        for key, value in enumerate(values):
+            dist.update(key, value)
+
+        ordered = sorted(values)
+        self.assertEqual(8, len(dist))
+        self.assertEqual(9, dist.max())
+        self.assertEqual(ordered[len(ordered) // 2], dist.median())
+        self.assertEqual(sum(values) / len(values), dist.mean())
+        self.assertEqual(1, dist.percentile(0))
+        self.assertEqual(9, dist.percentile(100))
+        self.assertEqual(ordered[6], dist.percentile(75))
+
+    def test_distribution_update(self):
+        """
+        Test replacing and removing values
+        """
+
+        dist = Distribution()
+        dist.update('a', 10)
+        dist.update('b', 2)
+        dist.update('a', 1)
+        self.assertEqual(2, dist.max())
+        self.assertEqual(1.5, dist.mean())
+
+        dist.remove('b')
+        dist.remove('missing')
+        self.assertEqual(1, len(dist))
+        self.assertEqual(1, dist.max())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+# --------------------------------
+# Unit tests for the API scraper -
+# Copyright (C) 2018 GameFrame   -
+# --------------------------------
+
+from datetime import datetime
+from types import SimpleNamespace
+from unittest import main, TestCase
+
+import vindex
+from orm import PlayerCount
+from vindex import (REFERENCES, WEIGHTS, Rollup, bucket, compute, load_columns,
+                    poll_interval, scores)
+
+
+def game(**columns):
+    """
+    Build a game row with every VINDEX input missing except the given ones
+    """
+    row = dict.fromkeys(vindex.FLAG_COLUMNS + vindex.VALUE_COLUMNS)
+    row.update(columns)
+    return SimpleNamespace(**row)
+
+
+def reference_vindex(game):
+    """
+    The VINDEX of one game computed with the per-game formula
+    """
+    esrb = 100 if game.esrb is not None else 0
+    website_score = 100 if game.website is not None else 0
+    metacritic_score = game.metacritic if game.metacritic is not None else 0
+    steam_igdb = 100 if game.steam_id is not None and game.igdb_id is not None \
+        else 50
+    player_score = 0
+    if game.steam_players is not None:
+        player_score = (game.steam_players / REFERENCES['players']) * 100
+
+    link_scores = {}
+    for link in ['article', 'video', 'tweet']:
+        count = getattr(game, link + '_count') or 0
+        link_scores[link] = (count / REFERENCES[link]) * 100
+
+    return min(int(round(WEIGHTS['esrb'] * esrb +
+                         WEIGHTS['website'] * website_score +
+                         WEIGHTS['metacritic'] * metacritic_score +
+                         WEIGHTS['steam_igdb'] * steam_igdb +
+                         WEIGHTS['players'] * player_score +
+                         WEIGHTS['articles'] * link_scores['article'] +
+                         WEIGHTS['videos'] * link_scores['video'] +
+                         WEIGHTS['tweets'] * link_scores['tweet'])), 100)
+
+
+class TestRollup (TestCase):
+
+    def test_bucket(self):
+        """
+        Test the starts of hourly and daily buckets
+        """
+
+        timestamp = datetime(2018, 4, 1, 23, 59, 30, 500)
+        self.assertEqual(datetime(2018, 4, 1, 23), bucket(timestamp, PlayerCount.HOURLY))
+        self.assertEqual(datetime(2018, 4, 1), bucket(timestamp, PlayerCount.DAILY))
+
+    def test_rollup(self):
+        """
+        Test that buckets complete once a later sample falls outside of them,
+        with the average and peak of their samples
+        """
+
+        rollup = Rollup()
+        self.assertEqual([], rollup.add(1, datetime(2018, 4, 1, 22, 10), 10))
+        self.assertEqual([], rollup.add(1, datetime(2018, 4, 1, 22, 40), 30))
+        self.assertEqual([], rollup.add(2, datetime(2018, 4, 1, 23, 0), 7))
+
+        # Crossing an hour completes the hourly bucket only
+        self.assertEqual([vindex.point(1, PlayerCount.HOURLY,
+                                       datetime(2018, 4, 1, 22), 20, 30)],
+                         rollup.add(1, datetime(2018, 4, 1, 23, 5), 50))
+
+        # Crossing a day completes the hourly and the daily bucket
+        self.assertEqual([vindex.point(1, PlayerCount.HOURLY,
+                                       datetime(2018, 4, 1, 23), 50, 50),
+                          vindex.point(1, PlayerCount.DAILY,
+                                       datetime(2018, 4, 1), 30, 50)],
+                         rollup.add(1, datetime(2018, 4, 2, 0, 5), 5))
+
+        # Discarded games start over
+        rollup.discard(2)
+        self.assertEqual([], rollup.add(2, datetime(2018, 4, 2, 1, 0), 9))
+
+    def test_poll_interval(self):
+        """
+        Test that poll intervals shrink with activity within their bounds
+        """
+
+        self.assertEqual(vindex.MAX_POLL_INTERVAL, poll_interval(None, None))
+        self.assertEqual(vindex.MAX_POLL_INTERVAL, poll_interval(0, 0))
+        self.assertEqual(vindex.MIN_POLL_INTERVAL, poll_interval(10 ** 6, 0))
+        self.assertEqual(vindex.MIN_POLL_INTERVAL, poll_interval(0, 10 ** 5))
+
+        interval = vindex.MAX_POLL_INTERVAL / (1 + 999 + vindex.PLAYERS_PER_VINDEX)
+        self.assertEqual(interval, poll_interval(999, 1))
+        self.assertLess(poll_interval(999, 1), poll_interval(999, None))
+
+
+class TestScores (TestCase):
+
+    def setUp(self):
+        self.references = dict(REFERENCES)
+        REFERENCES.update({'article': 10, 'video': 5, 'tweet': 20})
+
+    def tearDown(self):
+        REFERENCES.clear()
+        REFERENCES.update(self.references)
+
+    def test_scores(self):
+        """
+        Test that the vectorized scores match the per-game formula, including
+        missing inputs and the cap of 100
+        """
+
+        games = [game(),
+                 game(esrb='E', website='doom.com', metacritic=80, steam_id=1,
+                      igdb_id=2, steam_players=25000, article_count=5,
+                      video_count=5, tweet_count=10),
+                 game(steam_id=3, steam_players=10 ** 7, article_count=1000),
+                 game(steam_id=4, metacritic=71, article_count=1),
+                 game(igdb_id=5, video_count=2, tweet_count=None)]
+
+        self.assertEqual([5, 74, 100, 11, 13], scores(load_columns(games)).tolist())
+        self.assertEqual([reference_vindex(g) for g in games],
+                         scores(load_columns(games)).tolist())
+
+        for g in games:
+            compute(g)
+            self.assertEqual(reference_vindex(g), g.vindex)
+            self.assertIsInstance(g.vindex, int)
+
+
+if __name__ == '__main__':
+    main()
@@ -64,14 +64,8 @@ class SearchResults extends React.Component {
       video_results: {},
       // tweet_results {},
     };
-    this.updateGameItems = this.updateGameItems.bind(this);
-    this.updateDeveloperItems = this.updateDeveloperItems.bind(this);
-    this.updateArticleItems = this.updateArticleItems.bind(this);
-    this.updateVideoItems = this.updateVideoItems.bind(this);
-    this.updateGameItems();
-    this.updateDeveloperItems();
-    this.updateArticleItems();
-    this.updateVideoItems();
+    this.updateItems = this.updateItems.bind(this);
+    this.updateItems();
   }
 
   /**
@@ -81,77 +75,27 @@ class SearchResults extends React.Component {
     const newString = escape(decodeURI(window.location.href.substring(window.location.href.lastIndexOf('?q=') + 3))).split('%20').join(' ');//eslint-disable-line
     if (newString !== this.state.query_string) {
       this.state.query_string = newString;
-      this.updateGameItems();
-      this.updateDeveloperItems();
-      this.updateArticleItems();
-      this.updateVideoItems();
+      this.updateItems();
     }
   }
 
   /**
-   * @description - Fetches games similar in name, summary, website, genre(s), platform(s),
-   * or developer(s) to the query from the API.
+   * @description - Fetches games, developers, articles, and videos whose names contain the query
+   * from the API, ranked by visibility.
    */
-  updateGameItems() {
+  updateItems() {
     fetch(//eslint-disable-line
-      encodeURI(`${process.env.API_HOST}/v1/grid/game?q={"filters":[{"or":[{"name":"c_name","op":"like","val":"%${this.state.query_string}%"},`
-        .concat(`{"name":"summary","op":"like","val":"%20${this.state.query_string}%20"},{"name":"website","op":"like","val":"%${this.state.query_string}%"},`)
-        .concat(`{"name":"genres__name","op":"any","val":"${this.state.query_string}"},{"name":"platforms__name","op":"any","val":"${this.state.query_string}"},`)
-        .concat(`{"name":"developers__c_name","op":"any","val":"${this.state.query_string}"}]}],"order_by":[{"field":"vindex","direction":"desc"}]}&results_per_page=100`)),
+      encodeURI(`${process.env.API_HOST}/v1/search?q=${this.state.query_string}&results_per_page=100`),
       { method: 'GET' },
     )
       .then(response => response.json())
       .then((data) => {
-        this.setState({ game_results: data });
-      });
-  }
-
-  /**
-   * @description - Fetches developers similar in name, website, twitter, or game(s) to the query
-   * from the API.
-   */
-  updateDeveloperItems() {
-    fetch(//eslint-disable-line
-      encodeURI(`${process.env.API_HOST}/v1/grid/developer?q={"filters":[{"or":[{"name":"name","op":"like","val":"%${this.state.query_string}%"},`
-        .concat(`{"name":"website","op":"like","val":"%${this.state.query_string}%"},{"name":"twitter","op":"like","val":"%${this.state.query_string}%"},`)
-        .concat(`{"name":"games__c_name","op":"any","val":"${this.state.query_string}"}]}],"order_by":[{"field":"name","direction":"asc"}]}&results_per_page=100`)),
-      { method: 'GET' },
-    )
-      .then(response => response.json())
-      .then((data) => {
-        this.setState({ developer_results: data });
-      });
-  }
-
-  /**
-   * @description - Fetches articles similar in title, introduction, outlet, author, game(s), or
-   * developer(s) to the query from the API.
-   */
-  updateArticleItems() {
-    fetch(//eslint-disable-line
-      encodeURI(`${process.env.API_HOST}/v1/grid/article?q={"filters":[{"or":[{"name":"title","op":"like","val":"%${this.state.query_string}%"},`
-        .concat(`{"name":"introduction","op":"like","val":"%20${this.state.query_string}%20"},{"name":"outlet","op":"like","val":"%${this.state.query_string}%"},`)
-        .concat(`{"name":"author","op":"like","val":"%${this.state.query_string}%"},{"name":"games__c_name","op":"any","val":"${this.state.query_string}"},`)
-        .concat(`{"name":"developers__c_name","op":"any","val":"${this.state.query_string}"}]}],"order_by":[{"field":"title","direction":"asc"}]}&results_per_page=100`)),
-      { method: 'GET' },
-    )
-      .then(response => response.json())
-      .then((data) => {
-        this.setState({ article_results: data });
-      });
-  }
-
-  /**
-   * @description - Fetches videos similar in name to the query string from the API.
-   */
-  updateVideoItems() {
-    fetch(//eslint-disable-line
-      encodeURI(`${process.env.API_HOST}/v1/video?q={"filters":[{"name":"name","op":"like","val":"%${this.state.query_string}%"}],"order_by":[{"field":"name","direction":"asc"}]}&results_per_page=100`),
-      { method: 'GET' },
-    )
-      .then(response => response.json())
-      .then((data) => {
-        this.setState({ video_results: data });
+        this.setState({
+          game_results: data.game,
+          developer_results: data.developer,
+          article_results: data.article,
+          video_results: data.video,
+        });
       });
   }
 